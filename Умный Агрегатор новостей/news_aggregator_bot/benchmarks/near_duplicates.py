@@ -0,0 +1,58 @@
+"""
+проверка поиска дубликатов на размеченных новостях.
+
+запуск из каталога бота:
+    python benchmarks/near_duplicates.py [новости.json ...]
+
+без аргументов берется benchmarks/fixtures/near_duplicates.json: пересказы одних сюжетов
+разными словами (одинаковый story) и похожие по шаблону, но разные новости - ставка 16% и 18%,
+снегопад в Москве и дожди в Петербурге. для каждой пары печатается сходство и найдена ли она
+по полосам minhash; код выхода 1, если пересказ не склеился или разные новости склеились
+"""
+import glob
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import NEAR_DUPLICATE_SIMILARITY
+from utils.minhash import bands, features, is_duplicate, similarity
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def check(path: str) -> int:
+    """напечатать пары новостей файла, вернуть число ошибок"""
+    with open(path, encoding='utf-8') as f:
+        items = json.load(f)
+    prepared = []
+    for item in items:
+        item_features = features(item['title'], item['content'])
+        prepared.append((item, item_features, bands(item_features)))
+
+    print(f"\n{os.path.basename(path)}: {len(items)} новостей, порог сходства {NEAR_DUPLICATE_SIMILARITY}")
+    errors = 0
+    for i, (a, features_a, bands_a) in enumerate(prepared):
+        for b, features_b, bands_b in prepared[i + 1:]:
+            same = a['story'] == b['story']
+            candidate = bool(bands_a and bands_b and any(x == y for x, y in zip(bands_a, bands_b)))
+            duplicate = candidate and is_duplicate(features_a, features_b, NEAR_DUPLICATE_SIMILARITY)
+            if duplicate == same:
+                mark = '  '
+            else:
+                mark = '❌'
+                errors += 1
+            # несвязанные пары без ошибки не печатаются, чтобы не терялись интересные
+            if same or duplicate or similarity(features_a, features_b) >= NEAR_DUPLICATE_SIMILARITY / 2:
+                print(f"{mark} {a['story']:>10} / {b['story']:<10} сходство {similarity(features_a, features_b):.2f}"
+                      f"  кандидат {'да ' if candidate else 'нет'}  дубликат {'да' if duplicate else 'нет'}")
+    return errors
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(FIXTURES_DIR, 'near_duplicates*.json')))
+    errors = sum(check(path) for path in paths)
+    print(f"\n{'❌ ошибок: ' + str(errors) if errors else '✅ пересказы склеены, разные новости разделены'}")
+    sys.exit(1 if errors else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+сравнение парсеров html на сохраненных страницах.
+
+запуск из каталога бота:
+    python benchmarks/parser_benchmark.py [страница.html ...]
+
+без аргументов берутся страницы из benchmarks/fixtures: listing.html (страница-список)
+и article.html (страница новости). это синтетические страницы в разметке типичного
+новостного сайта; для точных цифр положите рядом сохраненные страницы своих источников
+"""
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup
+
+from utils.html_parser import HAS_LXML, HAS_SELECTOLAX, extract_links, make_soup
+from utils.site_profiles import default_profile
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+def _timeit(func, body: bytes, repeat: int) -> float:
+    """среднее время одного вызова в миллисекундах"""
+    func(body)  # прогрев
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(body)
+    return (time.perf_counter() - started) / repeat * 1000
+
+def _extract_content(soup) -> str:
+    """та же выборка контента, что и в extract_news_content, по общему профилю"""
+    profile = default_profile()
+    content = ""
+    for selector in profile.content_selectors:
+        for element in selector.select(soup):
+            text = element.get_text(strip=True)
+            if len(text) > profile.min_block_length:
+                content += " " + text
+                if len(content) > profile.content_length:
+                    return content
+    return content
+
+def _cases():
+    soup_backends = ['html.parser'] + (['lxml'] if HAS_LXML else [])
+    link_backends = soup_backends + (['selectolax'] if HAS_SELECTOLAX else [])
+    cases = []
+    for backend in soup_backends:
+        # как было раньше: полное дерево и find_all по нему
+        cases.append((f'ссылки, полное дерево ({backend})',
+                      lambda body, b=backend: BeautifulSoup(body, b).find_all('a', href=True)))
+    for backend in link_backends:
+        cases.append((f'ссылки, только <a> ({backend})', lambda body, b=backend: extract_links(body, b)))
+    for backend in soup_backends:
+        cases.append((f'контент новости ({backend})', lambda body, b=backend: _extract_content(make_soup(body, b))))
+    return cases
+
+def main(paths):
+    paths = paths or sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.html')))
+    repeat = int(os.environ.get('BENCH_REPEAT', '20'))
+    print(f"lxml: {'да' if HAS_LXML else 'нет'}, selectolax: {'да' if HAS_SELECTOLAX else 'нет'}, повторов: {repeat}")
+
+    for path in paths:
+        with open(path, 'rb') as f:
+            body = f.read()
+        print(f"\n📄 {os.path.basename(path)} ({len(body) // 1024} КБ)")
+        for name, func in _cases():
+            print(f"   {name:<40} {_timeit(func, body, repeat):8.2f} мс")
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
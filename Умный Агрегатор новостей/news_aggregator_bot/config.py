@@ -11,3 +11,72 @@ DEFAULT_CHECK_INTERVAL = 5  # минуты (интервал проверки н
 
 # настройки админа
 ADMIN_IDS = []  # id админов в телеграме
+
+# настройки http клиента парсера
+HTTP_CONNECT_TIMEOUT = 5  # секунды на установку соединения
+HTTP_TOTAL_TIMEOUT = 15  # секунды на весь запрос по умолчанию
+HTTP_LISTING_TIMEOUT = 15  # секунды на загрузку страницы со списком новостей
+HTTP_ARTICLE_TIMEOUT = 10  # секунды на загрузку страницы новости
+HTTP_POOL_LIMIT = 100  # всего одновременных соединений
+HTTP_POOL_LIMIT_PER_HOST = 8  # одновременных соединений на один сайт
+HTTP_KEEPALIVE_TIMEOUT = 30  # секунды жизни неактивного соединения
+FETCH_CONCURRENCY = 20  # всего одновременных загрузок страниц
+FETCH_PER_HOST_CONCURRENCY = 4  # одновременных загрузок с одного сайта
+FETCH_HOST_DELAY = 0.25  # секунды между началом запросов к одному сайту
+
+# парсер html: 'auto' (lxml и selectolax, если установлены), 'lxml', 'selectolax' или 'html.parser'
+HTML_PARSER = 'auto'
+
+# разбор html в пуле процессов
+PARSE_PROCESSES = os.cpu_count() or 1  # процессов разбора; 1 - разбирать в процессе бота
+PARSE_BACKLOG_PER_PROCESS = 2  # загруженных страниц в очереди к парсеру (и в разборе) на один процесс
+
+# поиск rss/atom лент источников
+FEED_DISCOVERY = True  # брать новости из ленты, если она есть, и разбирать html только без нее
+FEED_RECHECK_HOURS = 24  # как часто заново искать ленту (и как долго помнить, что ее нет)
+FEED_COMMON_PATHS = [  # типичные адреса лент, проверяются от раздела и от корня сайта
+    '/rss', '/feed', '/rss.xml', '/feed.xml', '/atom.xml', '/index.xml',
+    '/sitemap-news.xml', '/news-sitemap.xml'
+]
+
+# сравнение ключевых слов с новостями: 'substring' - подстрока без учета регистра,
+# 'morphology' - по основам слов, так что "выборы" находит и "выборов", и "выборами",
+# 'fts' - через полнотекстовый индекс sqlite fts5, как в поиске /search
+KEYWORD_MATCH_MODE = 'substring'
+
+# результатов поиска /search на одной странице
+SEARCH_PAGE_SIZE = 5
+
+# один сюжет с разных сайтов (почти одинаковые заголовок и текст) отправляется один раз
+NEAR_DUPLICATE_DETECTION = True
+NEAR_DUPLICATE_SIMILARITY = 0.35  # доля общих основ слов у дубликатов: пересказы сюжета - 0.4 и выше, разные новости - до 0.25
+NEAR_DUPLICATE_WINDOW_HOURS = 48  # среди новостей за сколько часов искать дубликаты
+
+# каталог с профилями сайтов (*.json): шаблоны ссылок, селекторы контента, пороги длины
+SITE_PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'site_profiles')
+
+# настройки пула соединений sqlite
+DB_POOL_SIZE = 4  # долгоживущих соединений в пуле
+DB_BUSY_TIMEOUT_MS = 5000  # сколько ждать снятия блокировки вместо "database is locked"
+DB_SYNCHRONOUS = 'NORMAL'  # в режиме WAL безопасно и заметно быстрее FULL
+DB_MMAP_SIZE = 64 * 1024 * 1024  # байт файла базы, читаемых через mmap
+SCHEDULER_DEBUG_LOG = False  # подробный лог выбора сайтов для проверки (уровень DEBUG логгера database)
+SCHEDULER_WORKERS = 8  # сколько источников проверяется одновременно
+SCHEDULER_RESYNC_INTERVAL = 600  # секунды между полной сверкой расписания с базой
+SCHEDULER_DELIVERY_MAX_DELAY = 60  # секунды, которые рассылка ждет окончания проверок текущего тика
+
+# адаптивный интервал опроса источников
+ADAPTIVE_POLLING = True  # подстраивать интервал под частоту публикаций источника
+ADAPTIVE_MIN_FACTOR = 0.5  # самый частый опрос: доля интервала пользователя (но не чаще раза в минуту)
+ADAPTIVE_MAX_FACTOR = 6  # самый редкий опрос: во сколько раз реже интервала пользователя
+ADAPTIVE_SMOOTHING = 0.5  # вес нового наблюдения при сглаживании интервала
+
+# настройки отправки сообщений в telegram
+DELIVERY_GLOBAL_RATE = 30  # сообщений в секунду на весь бот
+DELIVERY_CHAT_RATE = 1  # сообщений в секунду в один чат
+DELIVERY_WORKERS = 8  # сколько чатов обслуживается одновременно
+DELIVERY_MAX_ATTEMPTS = 5  # попыток отправки при сетевых ошибках
+DELIVERY_POLL_INTERVAL = 30  # секунды между проверками очереди на отложенные сообщения
+DELIVERY_KEEP_DAYS = 7  # сколько дней хранить отправленные сообщения очереди
+DELIVERY_ACK_BATCH = 50  # сколько подтверждений отправки копить перед записью в базу
+DELIVERY_ACK_INTERVAL = 1.0  # секунды, не дольше которых подтверждения ждут записи
@@ -1,14 +1,239 @@
+import json
 import sqlite3
 import asyncio
-from typing import List, Tuple, Optional
-from config import DATABASE_PATH
+import logging
+import time
+from typing import Dict, List, Tuple, Optional
+from config import SCHEDULER_DEBUG_LOG, ADAPTIVE_POLLING, ADAPTIVE_SMOOTHING, NEAR_DUPLICATE_DETECTION, NEAR_DUPLICATE_SIMILARITY, NEAR_DUPLICATE_WINDOW_HOURS
+from db_pool import connection, db_read, db_write
+from utils.adaptive import compute_poll_interval
+from utils.minhash import BANDS, bands, features, from_db, is_duplicate, to_db
+
+# подробный лог выбора сайтов включается через SCHEDULER_DEBUG_LOG в config.py
+logger = logging.getLogger('database')
+logger.setLevel(logging.DEBUG if SCHEDULER_DEBUG_LOG else logging.INFO)
+
+# миграции схемы: (версия, описание, список sql). текущая версия хранится в PRAGMA user_version.
+# новые миграции только добавляются в конец списка, уже выпущенные не меняются
+MIGRATIONS = [
+    (1, 'индексы для горячих запросов', [
+        'CREATE INDEX IF NOT EXISTS idx_sites_user_id ON sites (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_keywords_site_id ON keywords (site_id)',
+        'CREATE INDEX IF NOT EXISTS idx_news_site_id ON news (site_id, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_news_unsent ON news (site_id, id DESC) WHERE is_sent = 0',
+    ]),
+    (2, 'уникальность новости в пределах сайта, а не глобально', [
+        '''CREATE TABLE news_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            url TEXT NOT NULL,
+            content TEXT,
+            published_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_sent BOOLEAN DEFAULT FALSE,
+            sent_at TIMESTAMP,
+            UNIQUE (site_id, url),
+            FOREIGN KEY (site_id) REFERENCES sites (id)
+        )''',
+        '''INSERT INTO news_new (id, site_id, title, url, content, published_at, is_sent, sent_at)
+           SELECT id, site_id, title, url, content, published_at, is_sent, sent_at FROM news''',
+        'DROP TABLE news',
+        'ALTER TABLE news_new RENAME TO news',
+        'CREATE INDEX idx_news_site_id ON news (site_id, id DESC)',
+        'CREATE INDEX idx_news_unsent ON news (site_id, id DESC) WHERE is_sent = 0',
+        'CREATE INDEX idx_news_url ON news (url)',
+    ]),
+    (3, 'время следующей проверки сайта', [
+        'ALTER TABLE sites ADD COLUMN next_check_at INTEGER NOT NULL DEFAULT 0',
+        '''UPDATE sites SET next_check_at = COALESCE(CAST(strftime('%s', last_checked) AS INTEGER), 0)
+               + COALESCE((SELECT check_interval FROM users WHERE telegram_id = sites.user_id), 5) * 60''',
+        'CREATE INDEX idx_sites_next_check_at ON sites (next_check_at)',
+    ]),
+    (4, 'адаптивный интервал опроса', [
+        'ALTER TABLE sites ADD COLUMN poll_interval INTEGER',
+    ]),
+    (5, 'очередь исходящих сообщений', [
+        '''CREATE TABLE outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT NOT NULL,
+            news_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            created_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER))
+        )''',
+        # одна новость попадает в очередь чата не больше одного раза
+        'CREATE UNIQUE INDEX idx_outbox_chat_news ON outbox (chat_id, news_id) WHERE news_id IS NOT NULL',
+        '''CREATE INDEX idx_outbox_pending ON outbox (chat_id, id) WHERE status = 'pending' ''',
+    ]),
+    (6, 'режим дайджеста и связь сообщений очереди с несколькими новостями', [
+        "ALTER TABLE users ADD COLUMN delivery_mode TEXT NOT NULL DEFAULT 'single'",
+        # сообщение очереди может содержать несколько новостей (дайджест); новость попадает в чат один раз
+        '''CREATE TABLE outbox_news (
+            outbox_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            news_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, news_id)
+        )''',
+        'CREATE INDEX idx_outbox_news_outbox_id ON outbox_news (outbox_id)',
+        '''INSERT OR IGNORE INTO outbox_news (outbox_id, chat_id, news_id)
+           SELECT id, chat_id, news_id FROM outbox WHERE news_id IS NOT NULL''',
+    ]),
+    (7, 'найденные rss/atom ленты источников', [
+        # feed_url = NULL - ленты нет, до checked_at + FEED_RECHECK_HOURS разбирается html
+        '''CREATE TABLE feeds (
+            url TEXT PRIMARY KEY,
+            feed_url TEXT,
+            checked_at INTEGER NOT NULL
+        )''',
+    ]),
+    (8, 'полнотекстовый индекс новостей', [
+        # fts5 над заголовком и текстом новости, сама таблица news хранит данные (external content)
+        '''CREATE VIRTUAL TABLE news_fts USING fts5(
+            title, content, content='news', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''',
+        # триггеры держат индекс в соответствии с news
+        '''CREATE TRIGGER news_fts_insert AFTER INSERT ON news BEGIN
+            INSERT INTO news_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END''',
+        '''CREATE TRIGGER news_fts_delete AFTER DELETE ON news BEGIN
+            INSERT INTO news_fts (news_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+        END''',
+        '''CREATE TRIGGER news_fts_update AFTER UPDATE OF title, content ON news BEGIN
+            INSERT INTO news_fts (news_fts, rowid, title, content) VALUES ('delete', old.id, old.title, old.content);
+            INSERT INTO news_fts (rowid, title, content) VALUES (new.id, new.title, new.content);
+        END''',
+        # проиндексировать уже сохраненные новости
+        "INSERT INTO news_fts (news_fts) VALUES ('rebuild')",
+    ]),
+    (9, 'признаки новостей для поиска одного сюжета на разных сайтах', [
+        # features - признаки заголовка и текста (utils/minhash.py); cluster_id - id первой
+        # новости сюжета, NULL - похожих новостей не нашлось
+        'ALTER TABLE news ADD COLUMN features TEXT',
+        'ALTER TABLE news ADD COLUMN cluster_id INTEGER',
+        'CREATE INDEX idx_news_cluster_id ON news (cluster_id) WHERE cluster_id IS NOT NULL',
+        # полосы minhash: новости с совпадающей полосой - кандидаты в дубликаты
+        '''CREATE TABLE news_bands (
+            band INTEGER NOT NULL,
+            value INTEGER NOT NULL,
+            news_id INTEGER NOT NULL,
+            PRIMARY KEY (band, value, news_id)
+        ) WITHOUT ROWID''',
+        'CREATE INDEX idx_news_bands_news_id ON news_bands (news_id)',
+        '''CREATE TRIGGER news_bands_delete AFTER DELETE ON news BEGIN
+            DELETE FROM news_bands WHERE news_id = old.id;
+        END''',
+    ]),
+    (10, 'частота появления новых ссылок в списке источника', [
+        # url - нормализованный url источника, urls - json ссылок последнего списка,
+        # changed_at - когда в списке последний раз появилась новая ссылка
+        '''CREATE TABLE source_activity (
+            url TEXT PRIMARY KEY,
+            urls TEXT NOT NULL,
+            items_per_day REAL,
+            checked_at INTEGER NOT NULL,
+            changed_at INTEGER
+        )''',
+    ]),
+]
+
+# столбцы sites, которые отдаются наружу (кортеж из 5 элементов, как ожидают клавиатуры и обработчики)
+SITE_COLUMNS = 'id, user_id, url, last_checked, created_at'
+
+# выражение для времени следующей проверки сайта по интервалу его владельца (unix time)
+_NEXT_CHECK_SQL = '''CAST(strftime('%s', 'now') AS INTEGER)
+    + COALESCE((SELECT check_interval FROM users WHERE telegram_id = sites.user_id), 5) * 60'''
+
+# неотправленные новости всех пользователей, которые еще не стоят в очереди отправки.
+# новости одного сюжета (cluster_id) идут вместе, lead_id - первая из них. seen = 1 - другая
+# новость сюжета уже отправлена пользователю (или ее отправка не удалась окончательно, is_sent = 2)
+# или стоит в очереди. из остальных сюжетов -
+# не больше max_news_count самых свежих на пользователя. идет по частичному индексу idx_news_unsent
+_PENDING_DELIVERIES_SQL = '''
+    SELECT user_id, delivery_mode, news_id, title, url, content, lead_id, seen FROM (
+        SELECT p.*, DENSE_RANK() OVER (PARTITION BY user_id, seen ORDER BY lead_id DESC) AS rank
+        FROM (
+            SELECT s.user_id, u.delivery_mode, u.max_news_count,
+                   n.id AS news_id, n.title, n.url, n.content,
+                   MIN(n.id) OVER (PARTITION BY s.user_id, COALESCE(n.cluster_id, n.id)) AS lead_id,
+                   n.cluster_id IS NOT NULL AND EXISTS (
+                       SELECT 1 FROM news m
+                       JOIN sites sm ON sm.id = m.site_id AND sm.user_id = s.user_id
+                       WHERE m.cluster_id = n.cluster_id AND (m.is_sent != 0 OR EXISTS (
+                           SELECT 1 FROM outbox_news om WHERE om.chat_id = s.user_id AND om.news_id = m.id
+                       ))
+                   ) AS seen
+            FROM sites s
+            JOIN users u ON u.telegram_id = s.user_id
+            JOIN news n ON n.site_id = s.id AND n.is_sent = 0
+            WHERE NOT EXISTS (
+                SELECT 1 FROM outbox_news o WHERE o.chat_id = s.user_id AND o.news_id = n.id
+            )
+        ) p
+    )
+    WHERE seen OR rank <= max_news_count
+    ORDER BY user_id, lead_id DESC, news_id
+'''
+
+# неотправленные новости пользователя для ручного показа. столбцы перечислены явно:
+# признаки news.features здесь не нужны, а их текст большой
+_UNSENT_NEWS_FOR_USER_SQL = '''
+    SELECT n.id, n.site_id, n.title, n.url, n.content, n.cluster_id FROM news n
+    JOIN sites s ON n.site_id = s.id
+    WHERE s.user_id = ? AND n.is_sent = 0
+    ORDER BY n.id DESC
+'''
+
+# поиск по новостям сайтов пользователя: совпадение в заголовке весит больше, чем в тексте.
+# в сниппете найденные слова обрамлены символами \x02 и \x03 (см. utils/formatting.py)
+_SEARCH_NEWS_SQL = '''
+    SELECT n.id, n.title, n.url, snippet(news_fts, 1, char(2), char(3), '…', 24)
+    FROM news_fts
+    JOIN news n ON n.id = news_fts.rowid
+    JOIN sites s ON s.id = n.site_id
+    WHERE news_fts MATCH ? AND s.user_id = ?
+    ORDER BY bm25(news_fts, 10.0, 1.0)
+    LIMIT ? OFFSET ?
+'''
+
+# горячие запросы для диагностики планов выполнения: (название, sql, параметры)
+HOT_QUERIES = [
+    ('get_user_sites', f'SELECT {SITE_COLUMNS} FROM sites WHERE user_id = ?', (0,)),
+    ('get_sites_by_ids', f'SELECT {SITE_COLUMNS} FROM sites WHERE id IN (?, ?)', (0, 0)),
+    ('get_site_keywords', 'SELECT * FROM keywords WHERE site_id = ?', (0,)),
+    ('get_new_news_for_site', 'SELECT * FROM news WHERE site_id = ? ORDER BY id DESC', (0,)),
+    ('get_unsent_news_for_user', _UNSENT_NEWS_FOR_USER_SQL, (0,)),
+    ('get_known_news_contents', 'SELECT url, content FROM news WHERE url IN (?, ?)', ('', '')),
+    ('get_pending_deliveries', _PENDING_DELIVERIES_SQL, ()),
+    ('search_news', _SEARCH_NEWS_SQL, ('"новост"*', 0, 5, 0)),
+]
+
+def _apply_migrations(conn: sqlite3.Connection):
+    """применить миграции новее текущей PRAGMA user_version, каждую в своей транзакции"""
+    current_version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for version, description, statements in MIGRATIONS:
+        if version <= current_version:
+            continue
+        print(f"🔧 применяю миграцию {version}: {description}...")
+        try:
+            conn.execute('BEGIN')
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ ошибка миграции {version}: {e}")
+            raise
+        print(f"✅ миграция {version} применена")
 
-async def init_db():
+@db_write
+def init_db():
     """инициализация базы данных с логированием"""
     print("🛠️ начинаю инициализацию базы данных...")
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    
     tables = {
         'users': '''
             CREATE TABLE IF NOT EXISTS users (
@@ -46,315 +271,722 @@ async def init_db():
                 is_sent BOOLEAN DEFAULT FALSE,
                 sent_at TIMESTAMP,
                 FOREIGN KEY (site_id) REFERENCES sites (id)
+            )''',
+        'http_cache': '''
+            CREATE TABLE IF NOT EXISTS http_cache (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash TEXT,
+                payload TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )'''
     }
 
-    # создаем таблицы и проверяем их
-    for table_name, query in tables.items():
-        try:
-            print(f"🔨 создаю таблицу {table_name}...")
-            cursor.execute(query)
-            # проверяем что таблица создана
-            cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
-            if not cursor.fetchone():
-                print(f"❌ ошибка: таблица {table_name} не создана")
-            else:
-                print(f"✅ таблица {table_name} создана")
-        except Exception as e:
-            print(f"❌ ошибка при создании таблицы {table_name}: {e}")
-            raise
+    with connection() as conn:
+        cursor = conn.cursor()
+
+        # создаем таблицы и проверяем их
+        for table_name, query in tables.items():
+            try:
+                print(f"🔨 создаю таблицу {table_name}...")
+                cursor.execute(query)
+                # проверяем что таблица создана
+                cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
+                if not cursor.fetchone():
+                    print(f"❌ ошибка: таблица {table_name} не создана")
+                else:
+                    print(f"✅ таблица {table_name} создана")
+            except Exception as e:
+                print(f"❌ ошибка при создании таблицы {table_name}: {e}")
+                raise
 
-    conn.commit()
-    conn.close()
+        conn.commit()
+        _apply_migrations(conn)
     print("🛠️ инициализация базы данных завершена")
 
-async def add_user(telegram_id: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    # вставляем пользователя
-    cursor.execute('''
-        INSERT INTO users (telegram_id, check_interval, max_news_count)
-        VALUES (?, 5, 20)
-        ON CONFLICT(telegram_id) DO UPDATE SET
-            check_interval = COALESCE(check_interval, 5),
-            max_news_count = COALESCE(max_news_count, 20)
-    ''', (telegram_id,))
-    conn.commit()
-    conn.close()
-
-async def get_user(telegram_id: int) -> Optional[Tuple]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
-    user = cursor.fetchone()
-    conn.close()
+@db_write
+def add_user(telegram_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        # вставляем пользователя
+        cursor.execute('''
+            INSERT INTO users (telegram_id, check_interval, max_news_count)
+            VALUES (?, 5, 20)
+            ON CONFLICT(telegram_id) DO UPDATE SET
+                check_interval = COALESCE(check_interval, 5),
+                max_news_count = COALESCE(max_news_count, 20)
+        ''', (telegram_id,))
+        conn.commit()
+
+def _get_user(telegram_id: int) -> Optional[Tuple]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM users WHERE telegram_id = ?', (telegram_id,))
+        user = cursor.fetchone()
     return user
 
-async def update_user_check_interval(telegram_id: int, interval: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET check_interval = ? WHERE telegram_id = ?', (interval, telegram_id))
-    conn.commit()
-    conn.close()
-
-async def update_user_max_news_count(telegram_id: int, count: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET max_news_count = ? WHERE telegram_id = ?', (count, telegram_id))
-    conn.commit()
-    conn.close()
-
-async def get_user_settings(telegram_id: int) -> Tuple[int, int]:
+@db_read
+def get_user(telegram_id: int) -> Optional[Tuple]:
+    return _get_user(telegram_id)
+
+@db_write
+def update_user_check_interval(telegram_id: int, interval: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET check_interval = ? WHERE telegram_id = ?', (interval, telegram_id))
+        # пересчитываем время следующей проверки сайтов пользователя от их последней проверки,
+        # выученный адаптивный интервал сбрасываем к новому значению
+        cursor.execute('''
+            UPDATE sites SET next_check_at = COALESCE(CAST(strftime('%s', last_checked) AS INTEGER), 0) + ? * 60,
+                             poll_interval = NULL
+            WHERE user_id = ?
+        ''', (interval, telegram_id))
+        conn.commit()
+
+@db_write
+def update_user_max_news_count(telegram_id: int, count: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET max_news_count = ? WHERE telegram_id = ?', (count, telegram_id))
+        conn.commit()
+
+@db_write
+def update_user_delivery_mode(telegram_id: int, mode: str):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE users SET delivery_mode = ? WHERE telegram_id = ?', (mode, telegram_id))
+        conn.commit()
+
+@db_read
+def get_user_delivery_mode(telegram_id: int) -> str:
+    """Режим отправки новостей пользователю: 'single' - по одной, 'digest' - дайджестом"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT delivery_mode FROM users WHERE telegram_id = ?', (telegram_id,))
+        row = cursor.fetchone()
+    return row[0] if row else 'single'
+
+@db_read
+def get_user_settings(telegram_id: int) -> Tuple[int, int]:
     """Получить настройки пользователя: (check_interval, max_news_count)"""
-    user = await get_user(telegram_id)
+    user = _get_user(telegram_id)
     if user:
         return (user[2], user[3])  # check_interval, max_news_count
     return (5, 20)  # значения по умолчанию
 
-async def delete_all_user_data(telegram_id: int):
+@db_write
+def delete_all_user_data(telegram_id: int):
     """Удалить все сайты, ключевые слова и новости пользователя"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    with connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute('SELECT id FROM sites WHERE user_id = ?', (telegram_id,))
-    site_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute('SELECT id FROM sites WHERE user_id = ?', (telegram_id,))
+        site_ids = [row[0] for row in cursor.fetchall()]
 
-    if site_ids:
-        # удалить новости
-        placeholders = ','.join('?' * len(site_ids))
-        cursor.execute(f'DELETE FROM news WHERE site_id IN ({placeholders})', site_ids)
-
-        # удалить ключевые слова
-        cursor.execute(f'DELETE FROM keywords WHERE site_id IN ({placeholders})', site_ids)
-
-    # удалить сайты
-    cursor.execute('DELETE FROM sites WHERE user_id = ?', (telegram_id,))
-
-    conn.commit()
-    conn.close()
-
-async def add_site(user_id: int, url: str):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO sites (user_id, url, last_checked) VALUES (?, ?, CURRENT_TIMESTAMP)', (user_id, url))
-    conn.commit()
-    conn.close()
-
-async def get_user_sites(user_id: int) -> List[Tuple]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM sites WHERE user_id = ?', (user_id,))
-    sites = cursor.fetchall()
-    conn.close()
+        if site_ids:
+            # удалить новости
+            placeholders = ','.join('?' * len(site_ids))
+            cursor.execute(f'DELETE FROM news WHERE site_id IN ({placeholders})', site_ids)
+
+            # удалить ключевые слова
+            cursor.execute(f'DELETE FROM keywords WHERE site_id IN ({placeholders})', site_ids)
+
+        # удалить сайты
+        cursor.execute('DELETE FROM sites WHERE user_id = ?', (telegram_id,))
+
+        conn.commit()
+
+@db_write
+def add_site(user_id: int, url: str):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO sites (user_id, url, last_checked) VALUES (?, ?, CURRENT_TIMESTAMP)', (user_id, url))
+        cursor.execute(f'UPDATE sites SET next_check_at = {_NEXT_CHECK_SQL} WHERE id = ?', (cursor.lastrowid,))
+        conn.commit()
+
+@db_read
+def get_user_sites(user_id: int) -> List[Tuple]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {SITE_COLUMNS} FROM sites WHERE user_id = ?', (user_id,))
+        sites = cursor.fetchall()
     return sites
 
-async def delete_site(user_id: int, site_id: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM sites WHERE id = ? AND user_id = ?', (site_id, user_id))
-    conn.commit()
-    conn.close()
-
-async def update_site_last_checked(site_id: int):
-    """Обновить время последней проверки сайта"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE sites SET last_checked = CURRENT_TIMESTAMP WHERE id = ?', (site_id,))
-    conn.commit()
-    conn.close()
-
-async def get_sites_to_check() -> List[Tuple]:
-    """Получить сайты, которые нужно проверить (учитывая индивидуальные интервалы пользователей)"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    # получить сайты для которых прошло достаточно времени с момента последней проверки
-    # Детальное логирование процесса выбора сайтов
-    cursor.execute('''
-        SELECT 
-            s.id,
-            s.url,
-            s.last_checked,
-            u.check_interval,
-            strftime('%s', 'now') as current_time,
-            strftime('%s', s.last_checked) as last_checked_time,
-            (strftime('%s', 'now') - strftime('%s', s.last_checked)) as diff_seconds,
-            (u.check_interval * 60) as required_diff
-        FROM sites s
-        JOIN users u ON s.user_id = u.telegram_id
-        WHERE s.last_checked IS NULL
-        OR (strftime('%s', 'now') - strftime('%s', s.last_checked)) >= (u.check_interval * 60)
-    ''')
-
-    # Выводим отладочную информацию
-    debug_info = cursor.fetchall()
-    print("ℹ️ Отладочная информация по выборке сайтов:")
-    for row in debug_info:
-        print(f"""
-        Сайт ID: {row[0]}
-        URL: {row[1]}
-        Last checked: {row[2]}
-        Check interval: {row[3]} мин
-        Current time: {row[4]}
-        Last checked time: {row[5]}
-        Diff seconds: {row[6]}
-        Required diff: {row[7]}
-        {"Будет проверен" if row[2] is None or row[6] >= row[7] else "Не требует проверки"}
-        """)
-
-    # Повторно выполняем запрос для получения самих сайтов
-    cursor.execute('''
-        SELECT s.* FROM sites s
-        JOIN users u ON s.user_id = u.telegram_id
-        WHERE s.last_checked IS NULL
-        OR (strftime('%s', 'now') - strftime('%s', s.last_checked)) >= (u.check_interval * 60)
-    ''')
-
-    sites = cursor.fetchall()
-    conn.close()
+@db_write
+def delete_site(user_id: int, site_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM sites WHERE id = ? AND user_id = ?', (site_id, user_id))
+        conn.commit()
+
+@db_write
+def record_source_activity(source_url: str, urls: List[str]):
+    """
+    запомнить ссылки списка источника (нормализованный url) и обновить сглаженную частоту
+    появления новых ссылок. считаются все ссылки списка, до фильтрации по ключевым словам
+    """
+    now = int(time.time())
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT urls, items_per_day, checked_at, changed_at FROM source_activity WHERE url = ?',
+            (source_url,)
+        )
+        row = cursor.fetchone()
+        items_per_day, changed_at = None, None
+        if row:
+            previous_urls, items_per_day, checked_at, changed_at = row
+            new_count = len(set(urls) - set(json.loads(previous_urls)))
+            observed = new_count * 86400 / max(60, now - checked_at)
+            items_per_day = observed if items_per_day is None else (
+                (1 - ADAPTIVE_SMOOTHING) * items_per_day + ADAPTIVE_SMOOTHING * observed
+            )
+            if new_count:
+                changed_at = now
+        cursor.execute('''
+            INSERT INTO source_activity (url, urls, items_per_day, checked_at, changed_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(url) DO UPDATE SET
+                urls = excluded.urls, items_per_day = excluded.items_per_day,
+                checked_at = excluded.checked_at, changed_at = excluded.changed_at
+        ''', (source_url, json.dumps(urls), items_per_day, now, changed_at))
+        conn.commit()
+
+@db_write
+def update_site_last_checked(site_id: int, source_url: Optional[str] = None) -> Optional[int]:
+    """
+    Обновить время последней проверки сайта, вернуть новое next_check_at.
+    При ADAPTIVE_POLLING интервал подстраивается под частоту новых ссылок в списке источника
+    (source_url - нормализованный url, см. record_source_activity)
+    """
+    now = int(time.time())
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT s.url, s.poll_interval, COALESCE(u.check_interval, 5) FROM sites s
+            LEFT JOIN users u ON u.telegram_id = s.user_id
+            WHERE s.id = ?
+        ''', (site_id,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        url, poll_interval, check_interval = row
+
+        interval = check_interval * 60
+        if ADAPTIVE_POLLING:
+            cursor.execute(
+                'SELECT items_per_day, changed_at FROM source_activity WHERE url = ?', (source_url or url,)
+            )
+            activity = cursor.fetchone()
+            items_per_day, changed_at = activity if activity else (None, None)
+            idle_seconds = now - changed_at if changed_at else None
+            interval = compute_poll_interval(poll_interval, check_interval, items_per_day, idle_seconds)
+            logger.debug('site_poll site_id=%s items_per_day=%s idle_s=%s interval_s=%s',
+                         site_id, items_per_day, idle_seconds, interval)
+
+        next_check_at = now + interval
+        cursor.execute(
+            'UPDATE sites SET last_checked = CURRENT_TIMESTAMP, poll_interval = ?, next_check_at = ? WHERE id = ?',
+            (interval, next_check_at, site_id)
+        )
+        conn.commit()
+    return next_check_at
+
+@db_read
+def get_site_schedule(user_id: Optional[int] = None) -> List[Tuple[int, int]]:
+    """Получить (site_id, next_check_at) всех сайтов или сайтов одного пользователя"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        if user_id is None:
+            cursor.execute('SELECT id, next_check_at FROM sites')
+        else:
+            cursor.execute('SELECT id, next_check_at FROM sites WHERE user_id = ?', (user_id,))
+        schedule = cursor.fetchall()
+    return schedule
+
+@db_read
+def get_sites_by_ids(site_ids: List[int]) -> List[Tuple]:
+    """Получить сайты по списку id (удаленные сайты просто не попадут в результат)"""
+    if not site_ids:
+        return []
+    with connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ','.join('?' * len(site_ids))
+        cursor.execute(f'SELECT {SITE_COLUMNS} FROM sites WHERE id IN ({placeholders})', list(site_ids))
+        sites = cursor.fetchall()
     return sites
 
 # функции для работы с ключевыми словами
-async def add_keyword(site_id: int, keyword: str):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT INTO keywords (site_id, keyword) VALUES (?, ?)', (site_id, keyword))
-    conn.commit()
-    conn.close()
-
-async def get_site_keywords(site_id: int) -> List[Tuple]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM keywords WHERE site_id = ?', (site_id,))
-    keywords = cursor.fetchall()
-    conn.close()
+@db_write
+def add_keyword(site_id: int, keyword: str):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT INTO keywords (site_id, keyword) VALUES (?, ?)', (site_id, keyword))
+        conn.commit()
+
+@db_read
+def get_site_keywords(site_id: int) -> List[Tuple]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM keywords WHERE site_id = ?', (site_id,))
+        keywords = cursor.fetchall()
     return keywords
 
-async def delete_keyword(site_id: int, keyword_id: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('DELETE FROM keywords WHERE id = ? AND site_id = ?', (keyword_id, site_id))
-    conn.commit()
-    conn.close()
+@db_read
+def get_all_keywords() -> List[Tuple[int, str]]:
+    """(site_id, keyword) всех ключевых слов - для индекса подписок"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT site_id, keyword FROM keywords')
+        keywords = cursor.fetchall()
+    return keywords
 
-async def get_user_site_keywords(user_id: int) -> List[Tuple]:
+@db_write
+def delete_keyword(site_id: int, keyword_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM keywords WHERE id = ? AND site_id = ?', (keyword_id, site_id))
+        conn.commit()
+
+@db_read
+def get_keyword_site_id(keyword_id: int) -> Optional[int]:
+    """Получить site_id, к которому относится ключевое слово"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT site_id FROM keywords WHERE id = ?', (keyword_id,))
+        result = cursor.fetchone()
+    return result[0] if result else None
+
+@db_read
+def get_user_site_keywords(user_id: int) -> List[Tuple]:
     """Получить все ключевые слова пользователя для всех его сайтов"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT k.*, s.url FROM keywords k
-        JOIN sites s ON k.site_id = s.id
-        WHERE s.user_id = ?
-    ''', (user_id,))
-    keywords = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT k.*, s.url FROM keywords k
+            JOIN sites s ON k.site_id = s.id
+            WHERE s.user_id = ?
+        ''', (user_id,))
+        keywords = cursor.fetchall()
     return keywords
 
 # функции для работы с новостями
-async def add_news(site_id: int, title: str, url: str, content: str = ""):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO news (site_id, title, url, content) VALUES (?, ?, ?, ?)',
-                   (site_id, title, url, content))
-    conn.commit()
-    conn.close()
-
-async def get_unsent_news() -> List[Tuple]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM news WHERE is_sent = FALSE')
-    news = cursor.fetchall()
-    conn.close()
+@db_write
+def add_news(site_id: int, title: str, url: str, content: str = ""):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('INSERT OR IGNORE INTO news (site_id, title, url, content) VALUES (?, ?, ?, ?)',
+                       (site_id, title, url, content))
+        conn.commit()
+
+@db_read
+def get_unsent_news() -> List[Tuple]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM news WHERE is_sent = 0')
+        news = cursor.fetchall()
     return news
 
-async def mark_news_as_sent(news_id: int):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE news SET is_sent = TRUE WHERE id = ?', (news_id,))
-    conn.commit()
-    conn.close()
-
-async def get_all_sites() -> List[Tuple]:
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM sites')
-    sites = cursor.fetchall()
-    conn.close()
+@db_write
+def mark_news_as_sent(news_id: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('UPDATE news SET is_sent = TRUE WHERE id = ?', (news_id,))
+        conn.commit()
+
+@db_read
+def get_all_sites() -> List[Tuple]:
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT {SITE_COLUMNS} FROM sites')
+        sites = cursor.fetchall()
     return sites
 
-async def is_news_sent(url: str) -> bool:
+def _is_news_sent(url: str) -> bool:
     """Проверяет, была ли новость уже отправлена"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT id FROM news WHERE url = ? AND is_sent = TRUE', (url,))
-    result = cursor.fetchone()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id FROM news WHERE url = ? AND is_sent = TRUE', (url,))
+        result = cursor.fetchone()
     return result is not None
 
-async def get_unsent_news_for_user(user_id: int) -> List[Tuple]:
-    """Получить все неотправленные новости для пользователя"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT n.* FROM news n
-        JOIN sites s ON n.site_id = s.id
-        WHERE s.user_id = ? AND n.is_sent = FALSE
-        ORDER BY n.id DESC
-    ''', (user_id,))
-    news = cursor.fetchall()
-    conn.close()
+@db_read
+def is_news_sent(url: str) -> bool:
+    """Проверяет, была ли новость уже отправлена"""
+    return _is_news_sent(url)
+
+@db_read
+def get_unsent_news_for_user(user_id: int) -> List[Tuple]:
+    """Получить все неотправленные новости для пользователя: (id, site_id, title, url, content, cluster_id)"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_UNSENT_NEWS_FOR_USER_SQL, (user_id,))
+        news = cursor.fetchall()
     return news
 
-async def save_news_if_new(site_id: int, title: str, url: str, content: str = "") -> bool:
+@db_write
+def save_news_if_new(site_id: int, title: str, url: str, content: str = "") -> bool:
     """Сохраняет новость если она новая, возвращает True если сохранена"""
-    if await is_news_sent(url):
+    if _is_news_sent(url):
         print(f"📝 Новость уже отправлялась: {url}")
         return False  # новость уже отправлялась
 
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute(
-            'INSERT INTO news (site_id, title, url, content, is_sent) VALUES (?, ?, ?, ?, FALSE)',
-            (site_id, title, url, content)
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                'INSERT INTO news (site_id, title, url, content, is_sent) VALUES (?, ?, ?, ?, FALSE)',
+                (site_id, title, url, content)
+            )
+            conn.commit()
+            print(f"✅ Новость сохранена: {title[:50]}... ({url})")
+            return True
+        except sqlite3.IntegrityError:
+            print(f"📝 Новость уже существует: {url}")
+            # новость уже существует
+            return False
+
+@db_write
+def save_news_batch(site_id: int, items: List[Tuple[str, str, str]]) -> List[Tuple[int, str, str, str]]:
+    """
+    Сохраняет пачку новостей сайта одной транзакцией.
+    items: список (title, url, content).
+    Возвращает только реально новые строки (id, title, url, content)
+    """
+    if not items:
+        return []
+    urls = [url for _, url, _ in items]
+    placeholders = ','.join('?' * len(urls))
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT url FROM news WHERE site_id = ? AND url IN ({placeholders})', [site_id] + urls)
+        existing = {row[0] for row in cursor.fetchall()}
+        cursor.executemany(
+            'INSERT OR IGNORE INTO news (site_id, title, url, content, is_sent) VALUES (?, ?, ?, ?, FALSE)',
+            [
+                (site_id, title, url, content)
+                for title, url, content in items if url not in existing
+            ]
         )
+        new_urls = [url for url in urls if url not in existing]
+        saved = []
+        if new_urls:
+            new_placeholders = ','.join('?' * len(new_urls))
+            cursor.execute(
+                f'SELECT id, title, url, content FROM news WHERE site_id = ? AND url IN ({new_placeholders}) ORDER BY id',
+                [site_id] + new_urls
+            )
+            saved = cursor.fetchall()
+            if NEAR_DUPLICATE_DETECTION:
+                _assign_clusters(cursor, saved)
         conn.commit()
-        print(f"✅ Новость сохранена: {title[:50]}... ({url})")
-        return True
-    except sqlite3.IntegrityError:
-        print(f"📝 Новость уже существует: {url}")
-        # новость уже существует
-        return False
-    finally:
-        conn.close()
-
-async def get_new_news_for_site(site_id: int) -> List[Tuple]:
+    return saved
+
+def _assign_clusters(cursor: sqlite3.Cursor, saved: List[Tuple[int, str, str, str]]):
+    """
+    посчитать признаки новых новостей (id, title, url, content) и найти их сюжеты: кандидаты -
+    новости за NEAR_DUPLICATE_WINDOW_HOURS с совпадающей полосой minhash, дубликат - сходство
+    не ниже NEAR_DUPLICATE_SIMILARITY без расхождения в числах и именах (utils/minhash.py)
+    """
+    band_filter = ' OR '.join(['(b.band = ? AND b.value = ?)'] * BANDS)
+    window = f'-{int(NEAR_DUPLICATE_WINDOW_HOURS)} hours'
+    for news_id, title, _, content in saved:
+        news_features = features(title, content)
+        news_bands = bands(news_features)
+        if news_bands is None:
+            continue
+        cursor.execute(f'''
+            SELECT DISTINCT n.id, n.features, n.cluster_id FROM news_bands b
+            JOIN news n ON n.id = b.news_id
+            WHERE ({band_filter}) AND n.published_at >= datetime('now', ?)
+        ''', [param for band, band_value in enumerate(news_bands) for param in (band, band_value)] + [window])
+        matches = [
+            (other_cluster or other_id, other_id, other_cluster)
+            for other_id, other_features, other_cluster in cursor.fetchall()
+            if is_duplicate(news_features, from_db(other_features), NEAR_DUPLICATE_SIMILARITY)
+        ]
+
+        cluster_id = None
+        if matches:
+            # присоединяемся к самому раннему сюжету; первая новость сюжета получает cluster_id = свой id
+            cluster_id, lead_id, lead_cluster = min(matches)
+            if lead_cluster is None:
+                cursor.execute('UPDATE news SET cluster_id = ? WHERE id = ?', (lead_id, lead_id))
+        cursor.execute(
+            'UPDATE news SET features = ?, cluster_id = ? WHERE id = ?',
+            (to_db(news_features), cluster_id, news_id)
+        )
+        cursor.executemany(
+            'INSERT OR IGNORE INTO news_bands (band, value, news_id) VALUES (?, ?, ?)',
+            [(band, band_value, news_id) for band, band_value in enumerate(news_bands)]
+        )
+
+@db_read
+def get_known_news_contents(urls: List[str]) -> Dict[str, str]:
+    """Вернуть {url: content} для тех url из списка, которые уже есть в таблице news (для любого сайта)"""
+    if not urls:
+        return {}
+    with connection() as conn:
+        cursor = conn.cursor()
+        placeholders = ','.join('?' * len(urls))
+        cursor.execute(f'SELECT url, content FROM news WHERE url IN ({placeholders})', list(urls))
+        known = {url: content for url, content in cursor.fetchall()}
+    return known
+
+@db_read
+def search_news(user_id: int, query: str, limit: int, offset: int = 0) -> Tuple[int, List[Tuple[int, str, str, str]]]:
+    """
+    полнотекстовый поиск по новостям сайтов пользователя. query - запрос fts5 (utils/fts.fts_query).
+    возвращает (всего найдено, [(news_id, title, url, сниппет)] в порядке релевантности)
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) FROM news_fts
+            JOIN news n ON n.id = news_fts.rowid
+            JOIN sites s ON s.id = n.site_id
+            WHERE news_fts MATCH ? AND s.user_id = ?
+        ''', (query, user_id))
+        total = cursor.fetchone()[0]
+        results = []
+        if total > offset:
+            cursor.execute(_SEARCH_NEWS_SQL, (query, user_id, limit, offset))
+            results = cursor.fetchall()
+    return total, results
+
+@db_read
+def get_new_news_for_site(site_id: int) -> List[Tuple]:
     """Получить все новости для сайта"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM news WHERE site_id = ? ORDER BY id DESC', (site_id,))
-    news = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM news WHERE site_id = ? ORDER BY id DESC', (site_id,))
+        news = cursor.fetchall()
     return news
 
-async def mark_news_sent(news_id: int):
-    """отмечаю новость как отправленную"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    try:
-        cursor.execute('UPDATE news SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP WHERE id = ?', (news_id,))
+@db_read
+def get_pending_deliveries() -> Tuple[Dict[int, Tuple[str, List[Tuple[int, str, str, str]], Dict[int, List[int]]]], List[int]]:
+    """
+    новости к отправке одним запросом, сгруппированные по пользователю, по одной на сюжет:
+    ({user_id: (delivery_mode, [(news_id, title, url, content), ...], {news_id: [id дубликатов]})},
+     [id дубликатов уже отправленных или стоящих в очереди сюжетов])
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(_PENDING_DELIVERIES_SQL)
+        rows = cursor.fetchall()
+
+    deliveries = {}
+    duplicates_of_sent = []
+    for user_id, delivery_mode, news_id, title, url, content, lead_id, seen in rows:
+        if seen:
+            duplicates_of_sent.append(news_id)
+            continue
+        _, items, duplicates = deliveries.setdefault(user_id, (delivery_mode, [], {}))
+        if news_id == lead_id:
+            items.append((news_id, title, url, content))
+        else:
+            duplicates.setdefault(lead_id, []).append(news_id)
+    return deliveries, duplicates_of_sent
+
+@db_write
+def mark_news_batch_sent(news_ids: List[int]):
+    """отметить новости отправленными одной транзакцией (дубликаты уже отправленных сюжетов)"""
+    if not news_ids:
+        return
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany(
+            'UPDATE news SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP WHERE id = ?',
+            [(news_id,) for news_id in news_ids]
+        )
         conn.commit()
-        print(f"✅ Новость {news_id} помечена как отправленная")
-    except Exception as e:
-        print(f"❌ Ошибка при пометке новости {news_id} как отправленной: {e}")
-    finally:
-        conn.close()
 
-async def get_all_users() -> List[Tuple]:
+@db_write
+def mark_news_sent(news_id: int):
+    """отмечаю новость как отправленную"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute('UPDATE news SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP WHERE id = ?', (news_id,))
+            conn.commit()
+            print(f"✅ Новость {news_id} помечена как отправленная")
+        except Exception as e:
+            print(f"❌ Ошибка при пометке новости {news_id} как отправленной: {e}")
+
+@db_read
+def get_all_users() -> List[Tuple]:
     """Получить всех пользователей"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT telegram_id FROM users')
-    users = cursor.fetchall()
-    conn.close()
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT telegram_id FROM users')
+        users = cursor.fetchall()
     return users
+
+# функции для кэша http-валидаторов
+@db_read
+def get_http_cache(url: str) -> Optional[Tuple]:
+    """получить (etag, last_modified, content_hash, payload) для url"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT etag, last_modified, content_hash, payload FROM http_cache WHERE url = ?', (url,))
+        row = cursor.fetchone()
+    return row
+
+@db_write
+def save_http_cache(url: str, etag: Optional[str], last_modified: Optional[str], content_hash: str, payload: str):
+    """сохранить валидаторы, хэш тела и результат разбора страницы"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO http_cache (url, etag, last_modified, content_hash, payload, updated_at)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(url) DO UPDATE SET
+                etag = excluded.etag,
+                last_modified = excluded.last_modified,
+                content_hash = excluded.content_hash,
+                payload = excluded.payload,
+                updated_at = CURRENT_TIMESTAMP
+        ''', (url, etag, last_modified, content_hash, payload))
+        conn.commit()
+
+# функции для найденных лент источников
+@db_read
+def get_feed(url: str) -> Optional[Tuple[Optional[str], int]]:
+    """(feed_url, checked_at) для страницы-списка или None, если ленту еще не искали"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT feed_url, checked_at FROM feeds WHERE url = ?', (url,))
+        row = cursor.fetchone()
+    return row
+
+@db_write
+def save_feed(url: str, feed_url: Optional[str], checked_at: int):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO feeds (url, feed_url, checked_at) VALUES (?, ?, ?)',
+            (url, feed_url, checked_at)
+        )
+        conn.commit()
+
+# функции для очереди исходящих сообщений
+@db_write
+def enqueue_outbox(messages: List[Tuple[int, str, List[int]]]) -> int:
+    """
+    поставить сообщения (chat_id, text, news_ids) в очередь, вернуть сколько реально добавлено.
+    сообщение, все новости которого уже стоят в очереди этого чата, пропускается
+    """
+    if not messages:
+        return 0
+    added = 0
+    with connection() as conn:
+        cursor = conn.cursor()
+        for chat_id, text, news_ids in messages:
+            news_ids = list(news_ids)
+            if news_ids:
+                placeholders = ','.join('?' * len(news_ids))
+                cursor.execute(
+                    f'SELECT news_id FROM outbox_news WHERE chat_id = ? AND news_id IN ({placeholders})',
+                    [chat_id] + news_ids
+                )
+                if len(cursor.fetchall()) == len(set(news_ids)):
+                    continue
+            cursor.execute('INSERT INTO outbox (chat_id, text) VALUES (?, ?)', (chat_id, text))
+            outbox_id = cursor.lastrowid
+            cursor.executemany(
+                'INSERT OR IGNORE INTO outbox_news (outbox_id, chat_id, news_id) VALUES (?, ?, ?)',
+                [(outbox_id, chat_id, news_id) for news_id in news_ids]
+            )
+            added += 1
+        conn.commit()
+    return added
+
+@db_read
+def get_pending_outbox(chat_id: int, now: int) -> List[Tuple[int, str, int]]:
+    """неотправленные сообщения чата в порядке постановки: (id, text, attempts)"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, text, attempts FROM outbox
+            WHERE chat_id = ? AND status = 'pending' AND next_attempt_at <= ?
+            ORDER BY id
+        ''', (chat_id, now))
+        rows = cursor.fetchall()
+    return rows
+
+@db_read
+def get_pending_outbox_chats(now: int) -> List[int]:
+    """чаты, у которых есть сообщения, готовые к отправке"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT DISTINCT chat_id FROM outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+        ''', (now,))
+        chats = [row[0] for row in cursor.fetchall()]
+    return chats
+
+@db_write
+def mark_outbox_sent(outbox_ids: List[int]):
+    """отметить сообщения и все новости в них отправленными одной транзакцией"""
+    if not outbox_ids:
+        return
+    params = [(outbox_id,) for outbox_id in outbox_ids]
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("UPDATE outbox SET status = 'sent', error = NULL WHERE id = ?", params)
+        cursor.executemany('''
+            UPDATE news SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP
+            WHERE id IN (SELECT news_id FROM outbox_news WHERE outbox_id = ?)
+        ''', params)
+        conn.commit()
+
+@db_write
+def reschedule_outbox(outbox_id: int, next_attempt_at: int, attempts: int, error: str):
+    """отложить повторную попытку отправки"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE outbox SET next_attempt_at = ?, attempts = ?, error = ? WHERE id = ?',
+            (next_attempt_at, attempts, error, outbox_id)
+        )
+        conn.commit()
+
+@db_write
+def mark_outbox_failed(outbox_id: int, error: str):
+    """
+    больше не пытаться отправить сообщение. новости в нем получают is_sent = 2: иначе после
+    prune_outbox они снова попали бы в очередь, а частичный индекс idx_news_unsent рос бы без предела
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("UPDATE outbox SET status = 'failed', error = ? WHERE id = ?", (error, outbox_id))
+        cursor.execute(
+            'UPDATE news SET is_sent = 2 WHERE is_sent = 0 AND id IN (SELECT news_id FROM outbox_news WHERE outbox_id = ?)',
+            (outbox_id,)
+        )
+        conn.commit()
+
+@db_write
+def prune_outbox(older_than: int) -> int:
+    """удалить обработанные сообщения, созданные раньше older_than (unix time)"""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM outbox WHERE status != 'pending' AND created_at < ?", (older_than,))
+        deleted = cursor.rowcount
+        cursor.execute('DELETE FROM outbox_news WHERE outbox_id NOT IN (SELECT id FROM outbox)')
+        conn.commit()
+    return deleted
+
+# диагностика
+@db_read
+def explain_hot_queries() -> Tuple[int, List[Tuple[str, List[str]]]]:
+    """вернуть версию схемы и EXPLAIN QUERY PLAN для каждого горячего запроса"""
+    with connection() as conn:
+        schema_version = conn.execute('PRAGMA user_version').fetchone()[0]
+        plans = []
+        for name, query, params in HOT_QUERIES:
+            rows = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+            plans.append((name, [row[-1] for row in rows]))
+    return schema_version, plans
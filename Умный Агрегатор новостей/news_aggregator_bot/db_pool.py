@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional
+
+from config import DATABASE_PATH, DB_POOL_SIZE, DB_BUSY_TIMEOUT_MS, DB_SYNCHRONOUS, DB_MMAP_SIZE
+
+class ConnectionPool:
+    """небольшой пул долгоживущих соединений sqlite в режиме WAL"""
+
+    def __init__(self, path: str, size: int):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._all: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT_MS)}')
+        conn.execute(f'PRAGMA mmap_size={int(DB_MMAP_SIZE)}')
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        """взять свободное соединение, создать новое или дождаться освобождения"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._all) < self.size:
+                conn = self._connect()
+                self._all.append(conn)
+                return conn
+        return self._idle.get()
+
+    def release(self, conn: sqlite3.Connection):
+        # незавершенная транзакция не должна достаться следующему пользователю
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def close_all(self):
+        with self._lock:
+            for conn in self._all:
+                conn.close()
+            self._all.clear()
+            self._idle = queue.LifoQueue()
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+# запросы выполняются вне event loop: чтения параллельно, записи строго по очереди в одном потоке
+_read_executor: Optional[ThreadPoolExecutor] = None
+_write_executor: Optional[ThreadPoolExecutor] = None
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ConnectionPool(DATABASE_PATH, DB_POOL_SIZE)
+        return _pool
+
+@contextmanager
+def connection() -> Iterator[sqlite3.Connection]:
+    """
+    соединение из пула на время блока with.
+    изменения нужно подтверждать conn.commit(), иначе они откатываются при возврате в пул
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def _get_executors():
+    global _read_executor, _write_executor
+    with _pool_lock:
+        if _read_executor is None:
+            # одно соединение пула всегда остается писателю
+            _read_executor = ThreadPoolExecutor(max_workers=max(1, DB_POOL_SIZE - 1), thread_name_prefix='db-read')
+            _write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='db-write')
+        return _read_executor, _write_executor
+
+async def run_read(func: Callable, *args, **kwargs) -> Any:
+    """выполнить читающую функцию в потоке чтения"""
+    read_executor, _ = _get_executors()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(read_executor, functools.partial(func, *args, **kwargs))
+
+async def run_write(func: Callable, *args, **kwargs) -> Any:
+    """поставить пишущую функцию в очередь единственного потока записи"""
+    _, write_executor = _get_executors()
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(write_executor, functools.partial(func, *args, **kwargs))
+
+def db_read(func: Callable) -> Callable:
+    """превращает синхронную функцию чтения в корутину, выполняемую в потоке чтения"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_read(func, *args, **kwargs)
+    return wrapper
+
+def db_write(func: Callable) -> Callable:
+    """превращает синхронную функцию записи в корутину, выполняемую в потоке записи"""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_write(func, *args, **kwargs)
+    return wrapper
+
+def close_pool():
+    """остановить потоки базы и закрыть все соединения при остановке бота"""
+    global _pool, _read_executor, _write_executor
+    with _pool_lock:
+        executors = (_read_executor, _write_executor)
+        _read_executor = _write_executor = None
+    for executor in executors:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
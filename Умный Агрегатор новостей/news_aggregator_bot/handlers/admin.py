@@ -1,13 +1,15 @@
-import sqlite3
+import html
+
 from aiogram import Dispatcher, types
 from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from config import ADMIN_IDS, DATABASE_PATH
-from database import get_all_sites
+from config import ADMIN_IDS
+from database import get_all_sites, get_all_users, explain_hot_queries
 from parser import parse_news_from_url
 from keyboards import get_back_keyboard
+from utils.formatting import TELEGRAM_MESSAGE_LIMIT
 
 class AdminStates(StatesGroup):
     waiting_for_broadcast_message = State()
@@ -21,7 +23,8 @@ async def admin_command(message: types.Message):
     text = "Админ-панель:\n"
     text += "/stats - Статистика\n"
     text += "/broadcast - Отправить сообщение всем пользователям\n"
-    text += "/test_parse - Тестировать парсинг"
+    text += "/test_parse - Тестировать парсинг\n"
+    text += "/db_diag - Планы выполнения горячих запросов"
 
     await message.answer(text)
 
@@ -70,11 +73,7 @@ async def process_broadcast_message(message: types.Message, state: FSMContext):
         return
 
     # получить всех пользователей
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute('SELECT DISTINCT telegram_id FROM users')
-    users = cursor.fetchall()
-    conn.close()
+    users = await get_all_users()
 
     if not users:
         await message.answer("❌ Нет пользователей для рассылки.")
@@ -117,16 +116,39 @@ async def test_parse_command(message: types.Message):
         return
 
     url = sites[0][2]  # первый сайт
-    news = parse_news_from_url(url)
+    news = await parse_news_from_url(url)
     text = f"Найдено новостей на {url}: {len(news)}\n"
     for i, (title, link, content) in enumerate(news[:3], 1):
         text += f"{i}. {title[:50]}...\n"
 
     await message.answer(text)
 
+async def db_diag_command(message: types.Message):
+    """показать версию схемы и EXPLAIN QUERY PLAN горячих запросов"""
+    if message.from_user.id not in ADMIN_IDS:
+        return
+
+    schema_version, plans = await explain_hot_queries()
+    text = f"🛠️ Версия схемы: {schema_version}\n\n"
+    for name, steps in plans:
+        # в планах встречаются "<", ">" - сообщение отправляется в режиме html
+        block = f"<b>{html.escape(name)}</b>\n"
+        for step in steps:
+            # полный просмотр таблицы без индекса - повод добавить миграцию
+            marker = "⚠️" if step.startswith('SCAN') else "✅"
+            block += f"{marker} {html.escape(step)}\n"
+        block += "\n"
+        if len(text) + len(block) > TELEGRAM_MESSAGE_LIMIT:
+            await message.answer(text)
+            text = ""
+        text += block
+
+    await message.answer(text)
+
 def register(dp: Dispatcher):
     dp.message.register(admin_command, Command(commands=['admin']))
     dp.message.register(stats_command, Command(commands=['stats']))
     dp.message.register(broadcast_command, Command(commands=['broadcast']))
     dp.message.register(process_broadcast_message, StateFilter(AdminStates.waiting_for_broadcast_message))
     dp.message.register(test_parse_command, Command(commands=['test_parse']))
+    dp.message.register(db_diag_command, Command(commands=['db_diag']))
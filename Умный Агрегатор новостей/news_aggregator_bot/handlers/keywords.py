@@ -1,12 +1,12 @@
-import sqlite3
 from aiogram import Dispatcher, types
 from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
-from database import get_site_keywords, add_keyword, delete_keyword, get_user_sites
+from database import get_site_keywords, add_keyword, delete_keyword, get_user_sites, get_keyword_site_id
 from keyboards import get_keywords_keyboard, get_sites_keyboard, get_back_keyboard
+from utils.keyword_matcher import invalidate_keywords
 
 # глобальный словарь для хранения site_id по user_id
 user_site_map = {}
@@ -124,6 +124,7 @@ async def process_keyword(message: types.Message, state: FSMContext):
         site_id = int(site_id) 
 
         await add_keyword(site_id, keyword)
+        invalidate_keywords()
         await message.answer(f"✅ Ключевое слово '{keyword}' добавлено!")
 
         # показать обновленный список
@@ -158,15 +159,11 @@ async def delete_keyword_callback(callback: types.CallbackQuery):
         keyword_id = int(data.split('_')[-1])
 
         # найти site_id для этого keyword
-        conn = sqlite3.connect('news_aggregator.db')
-        cursor = conn.cursor()
-        cursor.execute('SELECT site_id FROM keywords WHERE id = ?', (keyword_id,))
-        result = cursor.fetchone()
-        conn.close()
-
-        if result:
-            site_id = result[0]
+        site_id = await get_keyword_site_id(keyword_id)
+
+        if site_id is not None:
             await delete_keyword(site_id, keyword_id)
+            invalidate_keywords()
 
             keywords = await get_site_keywords(site_id)
             text = f"🔑 Ключевые слова для сайта:"
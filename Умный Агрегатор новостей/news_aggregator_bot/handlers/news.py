@@ -1,37 +1,24 @@
+import html
+
 from aiogram import Dispatcher, types
 from aiogram.exceptions import TelegramBadRequest
-from aiogram.filters import StateFilter
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import get_user_sites, add_site, delete_site, get_all_sites, add_news, get_unsent_news, mark_news_sent, get_unsent_news_for_user
+from config import SEARCH_PAGE_SIZE
+from database import get_user_sites, add_site, delete_site, get_all_sites, add_news, get_unsent_news, get_unsent_news_for_user, get_user_delivery_mode, search_news
 from parser import parse_news_from_url, filter_news_by_keywords
-from keyboards import get_sites_keyboard, get_news_keyboard, get_back_keyboard, get_main_menu_keyboard
+from keyboards import get_sites_keyboard, get_news_keyboard, get_back_keyboard, get_main_menu_keyboard, get_search_keyboard
+from utils.scheduler import reschedule_sites
+from utils.delivery import enqueue_messages
+from utils.formatting import build_digest, format_news_message, format_search_results
+from utils.fts import fts_query
+from utils.keyword_matcher import invalidate_keywords
 
 async def send_single_news(bot, user_id: int, title: str, url: str, content: str):
     """отправить одну новость пользователю"""
-    # определить тип контента
-    content_type = "📰"
-    if "видео" in title.lower() or "🎥" in content or "🎬" in content:
-        content_type = "🎬"
-
-    # получить домен сайта
-    from urllib.parse import urlparse
-    domain = urlparse(url).netloc.replace('www.', '')
-
-    # форматировать заголовок
-    formatted_title = title[:100] + "..." if len(title) > 100 else title
-
-    news_text = f"{content_type} <b>{formatted_title}</b>\n"
-    news_text += f"📍 Источник: {domain}\n"
-
-    if content:
-        clean_content = content.replace('\n', ' ').strip()
-        news_text += f"\n{clean_content}\n\n"
-    news_text += "\n"
-
-    news_text += f"🔗 <a href='{url}'>Читать полностью</a>\n"
-    news_text += f"{'─' * 30}"
+    news_text = format_news_message(title, url, content)
 
     try:
         await bot.send_message(
@@ -91,6 +78,7 @@ async def process_site(message: types.Message, state: FSMContext):
         return
 
     await add_site(user_id, url)
+    await reschedule_sites(user_id)
     await message.answer(f"✅ Сайт '{url}' добавлен!")
 
     sites = await get_user_sites(user_id)
@@ -106,6 +94,7 @@ async def delete_site_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
 
     await delete_site(user_id, site_id)
+    invalidate_keywords()
     await callback.answer("🗑️ Сайт удален!")
 
     sites = await get_user_sites(user_id)
@@ -197,13 +186,16 @@ async def fetch_news_callback(callback: types.CallbackQuery):
     filtered_news = [news for news in all_news if news[1] in user_site_ids]  # news[1] это site_id
     print(f"🔍 Новостей для сайтов пользователя: {len(filtered_news)}")
 
-    # Дополнительная фильтрация - убедимся, что нет дубликатов по URL
+    # Дополнительная фильтрация - убедимся, что нет дубликатов по URL и по сюжету (cluster_id).
+    # пропущенные повторы сюжета планировщик отметит отправленными вместе с показанной новостью
     seen_urls = set()
+    seen_clusters = set()
     unique_news = []
     for news_item in filtered_news:
-        news_id, site_id, title, url, content, _, _, _ = news_item
-        if url not in seen_urls:
+        news_id, site_id, title, url, content, cluster_id = news_item
+        if url not in seen_urls and (cluster_id is None or cluster_id not in seen_clusters):
             seen_urls.add(url)
+            seen_clusters.add(cluster_id)
             unique_news.append(news_item)
 
     print(f"🔍 После фильтрации дубликатов: {len(unique_news)} новостей")
@@ -221,57 +213,27 @@ async def fetch_news_callback(callback: types.CallbackQuery):
 
     if recent_news:
         print(f"✅ Найдено {len(recent_news)} новостей для отправки пользователю {user_id}")
-        # отправить новости отдельными сообщениями
-        sent_count = 0
+        messages = []
+        if await get_user_delivery_mode(user_id) == 'digest':
+            # упаковать новости в несколько сообщений-дайджестов
+            items = [(news_id, title, url, content) for news_id, _, title, url, content, *_ in recent_news]
+            for text, news_ids in build_digest(items):
+                messages.append((user_id, text, news_ids))
+            recent_news = []
+
+        # поставить новости в очередь отправки отдельными сообщениями
         for i, news_item in enumerate(recent_news):
-            news_id, site_id, title, url, content, _, _, _ = news_item
-            print(f"📰 Отправляю новость {i+1}: {title[:50]}...")
-
-            # определить тип контента
-            content_type = "📰"
-            if "видео" in title.lower() or "🎥" in content or "🎬" in content:
-                content_type = "🎬"
-
-            # получить домен сайта для отображения
-            from urllib.parse import urlparse
-            domain = urlparse(url).netloc.replace('www.', '')
-
-            # форматировать заголовок
-            formatted_title = title[:100] + "..." if len(title) > 100 else title
-
-            news_text = f"{content_type} <b>{formatted_title}</b>\n"
-            news_text += f"📍 Источник: {domain}\n"
-
-            if content:
-                clean_content = content.replace('\n', ' ').strip()
-                news_text += f"\n{clean_content}\n\n"
-            news_text += "\n"
-
-            news_text += f"🔗 <a href='{url}'>Читать полностью</a>\n"
-            news_text += f"{'─' * 30}"
-
-            try:
-                await callback.bot.send_message(
-                    user_id,
-                    news_text,
-                    parse_mode='HTML',
-                    disable_web_page_preview=True
-                )
-                # Помечаем новость как отправленную ТОЛЬКО после успешной отправки
-                await mark_news_sent(news_id)
-                sent_count += 1
-                print(f"✅ Новость {i+1} отправлена успешно и помечена как отправленная")
-
-            except Exception as e:
-                print(f"❌ Ошибка отправки новости {i+1} пользователю {user_id}: {e}")
-
-        # отправить итоговое сообщение
-        summary_text = f"✅ Показано {sent_count} последних новостей из базы данных!"
-        try:
-            await callback.bot.send_message(user_id, summary_text)
-            print(f"✅ Итоговое сообщение отправлено: {summary_text}")
-        except Exception as e:
-            print(f"❌ Ошибка отправки итогового сообщения пользователю {user_id}: {e}")
+            news_id, site_id, title, url, content, *_ = news_item
+            print(f"📰 Ставлю в очередь новость {i+1}: {title[:50]}...")
+            messages.append((user_id, format_news_message(title, url, content), [news_id]))
+
+        # итоговое сообщение идет через ту же очередь, чтобы прийти после новостей.
+        # новость помечается отправленной только после того, как telegram ее принял
+        news_count = sum(len(news_ids) for _, _, news_ids in messages)
+        summary_text = f"✅ Показано {news_count} последних новостей из базы данных!"
+        messages.append((user_id, summary_text, []))
+        await enqueue_messages(messages)
+        print(f"✅ В очередь поставлено {news_count} новостей для пользователя {user_id}")
     else:
         print(f"❌ Новости не найдены для пользователя {user_id}")
         try:
@@ -282,9 +244,52 @@ async def fetch_news_callback(callback: types.CallbackQuery):
         except Exception as e:
             print(f"❌ Ошибка отправки сообщения 'новостей нет' пользователю {user_id}: {e}")
 
+async def _search_page(user_id: int, query_text: str, page: int):
+    """текст и клавиатура страницы результатов поиска"""
+    total, results = await search_news(user_id, fts_query(query_text), SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    if not total:
+        return f"🔎 По запросу «{html.escape(query_text)}» ничего не найдено.", get_back_keyboard()
+    pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+    page = min(page, pages - 1)
+    if not results:
+        # новостей стало меньше, чем было при показе предыдущей страницы
+        total, results = await search_news(user_id, fts_query(query_text), SEARCH_PAGE_SIZE, page * SEARCH_PAGE_SIZE)
+    return format_search_results(query_text, results, page, pages, total), get_search_keyboard(page, pages)
+
+async def search_command(message: types.Message, command: CommandObject, state: FSMContext):
+    """поиск по сохраненным новостям сайтов пользователя: /search запрос"""
+    query_text = (command.args or '').strip()
+    if not query_text:
+        await message.answer("🔎 Напишите, что искать, например: /search выборы президента")
+        return
+    if not fts_query(query_text):
+        await message.answer("❌ В запросе нет слов для поиска. Попробуйте снова.")
+        return
+
+    # запрос хранится в данных состояния, в кнопках листания - только номер страницы
+    await state.update_data(search_text=query_text)
+    text, keyboard = await _search_page(message.from_user.id, query_text, 0)
+    await message.answer(text, parse_mode='HTML', reply_markup=keyboard, disable_web_page_preview=True)
+
+async def search_page_callback(callback: types.CallbackQuery, state: FSMContext):
+    """показать другую страницу результатов поиска"""
+    await callback.answer()
+    page = int(callback.data.split('_')[-1])
+    query_text = (await state.get_data()).get('search_text')
+    if not query_text:
+        text, keyboard = "🔎 Поиск устарел, повторите его командой /search", get_back_keyboard()
+    else:
+        text, keyboard = await _search_page(callback.from_user.id, query_text, page)
+    try:
+        await callback.message.edit_text(text, parse_mode='HTML', reply_markup=keyboard, disable_web_page_preview=True)
+    except Exception:
+        pass
+
 def register(dp: Dispatcher):
     dp.callback_query.register(manage_sites_callback, lambda c: c.data == "manage_sites")
     dp.callback_query.register(add_site_callback, lambda c: c.data == "add_site")
     dp.callback_query.register(delete_site_callback, lambda c: c.data.startswith("delete_site_"))
     dp.callback_query.register(get_news_callback, lambda c: c.data == "get_news")
     dp.message.register(process_site, StateFilter(SiteStates.waiting_for_site))
+    dp.message.register(search_command, Command(commands=['search']))
+    dp.callback_query.register(search_page_callback, lambda c: c.data.startswith("search_page_"))
@@ -2,8 +2,13 @@ from aiogram import Dispatcher, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-from database import delete_all_user_data, get_user_settings, update_user_check_interval, update_user_max_news_count
-from keyboards import get_settings_keyboard, get_confirm_delete_keyboard, get_main_menu_keyboard, get_back_keyboard
+from database import (
+    delete_all_user_data, get_user_settings, update_user_check_interval, update_user_max_news_count,
+    get_user_delivery_mode, update_user_delivery_mode
+)
+from keyboards import get_settings_keyboard, get_confirm_delete_keyboard, get_main_menu_keyboard, get_back_keyboard, get_delivery_mode_keyboard
+from utils.scheduler import reschedule_sites
+from utils.keyword_matcher import invalidate_keywords
 
 class SettingsStates(StatesGroup):
     waiting_for_interval = State()
@@ -34,6 +39,7 @@ async def confirm_delete_all_callback(callback: types.CallbackQuery):
     user_id = callback.from_user.id
 
     await delete_all_user_data(user_id)
+    invalidate_keywords()
     text = "🗑️ Все ваши данные удалены!\n\nДобавьте сайты заново для продолжения работы."
 
     try:
@@ -81,6 +87,34 @@ async def set_max_news_count_callback(callback: types.CallbackQuery, state: FSMC
     except Exception:
         pass
 
+def _delivery_mode_text(mode: str) -> str:
+    text = "📬 Режим отправки новостей\n\n"
+    text += "• Каждая новость отдельно - одно сообщение на новость\n"
+    text += "• Дайджест - новости собираются в несколько сообщений, сгруппированных по источникам\n\n"
+    text += f"Сейчас: {'дайджест' if mode == 'digest' else 'каждая новость отдельно'}"
+    return text
+
+async def set_delivery_mode_callback(callback: types.CallbackQuery):
+    """показать выбор режима отправки"""
+    await callback.answer()
+    mode = await get_user_delivery_mode(callback.from_user.id)
+
+    try:
+        await callback.message.edit_text(_delivery_mode_text(mode), reply_markup=get_delivery_mode_keyboard(mode))
+    except Exception:
+        pass
+
+async def delivery_mode_choice_callback(callback: types.CallbackQuery):
+    """сохранить выбранный режим отправки"""
+    mode = callback.data.replace("delivery_mode_", "")
+    await update_user_delivery_mode(callback.from_user.id, mode)
+    await callback.answer("✅ Режим отправки сохранен")
+
+    try:
+        await callback.message.edit_text(_delivery_mode_text(mode), reply_markup=get_delivery_mode_keyboard(mode))
+    except Exception:
+        pass
+
 async def process_interval_input(message: types.Message, state: FSMContext):
     """обработать ввод интервала"""
     user_id = message.from_user.id
@@ -96,6 +130,8 @@ async def process_interval_input(message: types.Message, state: FSMContext):
             return
 
         await update_user_check_interval(user_id, interval)
+        # планировщик сразу пересчитает сроки сайтов пользователя
+        await reschedule_sites(user_id)
         await message.answer(f"✅ Интервал проверки установлен на {interval} минут!")
 
         # показать меню настроек
@@ -139,6 +175,8 @@ def register(dp: Dispatcher):
     dp.callback_query.register(settings_callback, lambda c: c.data == "settings")
     dp.callback_query.register(set_check_interval_callback, lambda c: c.data == "set_check_interval")
     dp.callback_query.register(set_max_news_count_callback, lambda c: c.data == "set_max_news_count")
+    dp.callback_query.register(set_delivery_mode_callback, lambda c: c.data == "set_delivery_mode")
+    dp.callback_query.register(delivery_mode_choice_callback, lambda c: c.data in ("delivery_mode_single", "delivery_mode_digest"))
     dp.callback_query.register(delete_all_data_callback, lambda c: c.data == "delete_all_data")
     dp.callback_query.register(confirm_delete_all_callback, lambda c: c.data == "confirm_delete_all")
     dp.message.register(process_interval_input, SettingsStates.waiting_for_interval)
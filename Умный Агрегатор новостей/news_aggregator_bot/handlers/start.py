@@ -27,7 +27,8 @@ async def commands_button_handler(message: types.Message):
     """📋 команды"""
     text = (
         "📋 Доступные команды:\n\n"
-        "/start - Запустить бота\n\n"
+        "/start - Запустить бота\n"
+        "/search запрос - Поиск по сохраненным новостям\n\n"
         "💡 <b>Основное использование:</b>\n"
         "Отправьте ссылку на раздел новостей сайта\n"
         "(например: https://tass.ru/obschestvo)"
@@ -52,6 +52,7 @@ def get_settings_keyboard():
     keyboard = [
         [InlineKeyboardButton(text="⏰ Интервал проверки", callback_data="set_check_interval")],
         [InlineKeyboardButton(text="📊 Кол-во новостей", callback_data="set_max_news_count")],
+        [InlineKeyboardButton(text="📬 Режим отправки", callback_data="set_delivery_mode")],
         [InlineKeyboardButton(text="🗑️ Удалить все данные", callback_data="delete_all_data")],
         [InlineKeyboardButton(text="⬅️ Назад", callback_data="back_to_main")]
     ]
@@ -61,6 +62,29 @@ def get_interval_keyboard():
     """клавиатура выбора интервала (deprecated)"""
     return get_back_keyboard()
 
+def get_delivery_mode_keyboard(current_mode: str):
+    """клавиатура выбора режима отправки"""
+    def mark(mode: str) -> str:
+        return "✅ " if mode == current_mode else ""
+
+    keyboard = [
+        [InlineKeyboardButton(text=f"{mark('single')}📰 Каждая новость отдельно", callback_data="delivery_mode_single")],
+        [InlineKeyboardButton(text=f"{mark('digest')}🗞 Дайджест", callback_data="delivery_mode_digest")],
+        [InlineKeyboardButton(text="⬅️ Назад", callback_data="settings")]
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+def get_search_keyboard(page: int, pages: int):
+    """листание результатов поиска"""
+    row = []
+    if page > 0:
+        row.append(InlineKeyboardButton(text="⬅️ Предыдущие", callback_data=f"search_page_{page - 1}"))
+    if page + 1 < pages:
+        row.append(InlineKeyboardButton(text="Следующие ➡️", callback_data=f"search_page_{page + 1}"))
+    keyboard = [row] if row else []
+    keyboard.append([InlineKeyboardButton(text="🏠 Главное меню", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
 def get_confirm_delete_keyboard():
     """клавиатура подтверждения удаления"""
     keyboard = [
@@ -7,8 +7,13 @@ from aiogram.enums import ParseMode
 
 from config import BOT_TOKEN
 from database import init_db
+from db_pool import close_pool
 from handlers import register_handlers
-from utils.scheduler import start_scheduler
+from utils.scheduler import start_scheduler, stop_scheduler
+from utils.delivery import start_delivery, stop_delivery
+from utils.http_client import close_session
+from utils.parse_pool import close_parse_pool
+from utils.site_profiles import load_profiles
 
 async def main():
     bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
@@ -17,7 +22,9 @@ async def main():
     register_handlers(dp)
 
     await init_db()
+    load_profiles()
 
+    start_delivery(bot)
     start_scheduler(bot)
 
     def signal_handler(signum, frame):
@@ -35,6 +42,12 @@ async def main():
     except Exception as e:
         print(f"\n❌ Ошибка при работе бота: {e}")
     finally:
+        # сначала планировщик: он ставит сообщения в очередь отправки
+        await stop_scheduler()
+        await stop_delivery()
+        await close_session()
+        close_parse_pool()
+        close_pool()
         print("👋 Работа бота завершена.")
 
 if __name__ == "__main__":
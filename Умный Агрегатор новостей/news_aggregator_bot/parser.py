@@ -1,216 +1,261 @@
-import requests
-from bs4 import BeautifulSoup
-from typing import List, Tuple, Optional
+import asyncio
+import json
+from typing import Dict, List, Tuple, Optional
+from urllib.parse import urlparse, urlunparse
 import logging
 import re
-import time
+
+from config import HTTP_LISTING_TIMEOUT, HTTP_ARTICLE_TIMEOUT, FEED_DISCOVERY
+from database import get_known_news_contents
+from utils.feeds import discover_feed, forget_feed, parse_feed
+from utils.http_cache import fetch_page, remember_page
+from utils.keyword_matcher import compile_keywords
+from utils.html_parser import make_soup, extract_links
+from utils.parse_pool import run_parse
+from utils.site_profiles import get_profile, default_profile, profile_for
 
 logging.basicConfig(level=logging.INFO)
 
+# загрузки, которые сейчас выполняются: нормализованный url -> задача парсинга
+_inflight: Dict[str, asyncio.Task] = {}
+
+def normalize_url(url: str) -> str:
+    """
+    приводит url источника к каноничному виду для дедупликации загрузок:
+    схема и домен в нижнем регистре, без порта по умолчанию, якоря и завершающего слеша
+    """
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == 'http' and netloc.endswith(':80')) or (scheme == 'https' and netloc.endswith(':443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parsed.path.rstrip('/') or '/'
+    return urlunparse((scheme, netloc, path, parsed.params, parsed.query, ''))
+
 async def parse_news_from_url(url: str, site_id: int = None) -> List[Tuple[str, str, str]]:
     """
     улучшенный парсер новостей
     """
-    try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        print(f"🔍 начинаем парсинг сайта: {url}")
-        response = requests.get(url, headers=headers, timeout=15)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        print(f"✅ сайт загружен, статус: {response.status_code}, кодировка: {response.encoding}")
-
-        soup = BeautifulSoup(response.content, 'html.parser')
-        news_items = []
+    news_items = await fetch_news_from_url(url)
 
-        print(f"🔍 парсинг новостей с {url}")
-
-        # ищем все возможные ссылки на новости
-        all_links = soup.find_all('a', href=True)
-        print(f"🔍 найдено {len(all_links)} ссылок на странице")
-
-        found_news_count = 0
-        processed_urls = set()  # для избежания дубликатов
-
-        for i, link in enumerate(all_links[:100]):  # проверяем первые 100 ссылок
-            href = link.get('href')
-            text = link.get_text(strip=True)
-
-            if not href or not text or len(text) < 5:
-                continue
-
-            # очищаем и нормализуем url
-            href = clean_url(href, url)
-            
-            # проверяем на дубликаты
-            if href in processed_urls:
-                continue
-            processed_urls.add(href)
-
-            # проверяем, является ли это ссылкой на новость
-            if is_news_link(href, url):
-                # пытаемся извлечь контент новости
-                content = await extract_news_content(href, text)
-                
-                # если не удалось извлечь контент, используем заголовок как контент
-                if not content or len(content) < 10:
-                    content = text[:200]
-
-                # очищаем заголовок
-                title = re.sub(r'\s+', ' ', text).strip()
-
-                news_items.append((title, href, content))
-                found_news_count += 1
-                print(f"✅ найдена новость {found_news_count}: {title[:50]}...")
-                print(f"   url: {href}")
-                print(f"   content: {content[:100]}...")
-                
-                if found_news_count >= 15:  # ограничиваем количество найденных новостей
-                    break
+    # сохраняем новости в базу данных
+    if site_id is not None:
+        try:
+            from database import save_news_batch
+            saved = await save_news_batch(site_id, news_items)
+            print(f"✅ сохранено {len(saved)} новостей в базу данных")
+        except Exception as e:
+            print(f"⚠️ предупреждение: не удалось сохранить новости в базу данных: {e}")
+    else:
+        print("⚠️ предупреждение: site_id не указан, новости не будут сохранены в базу данных")
 
-        print(f"📊 всего найдено новостей: {found_news_count}")
-        print(f"📊 всего уникальных новостей: {len(news_items)}")
+    return news_items
 
-        # сохраняем новости в базу данных
-        if site_id is not None:
-            try:
-                from database import save_news_if_new
-                saved_count = 0
-                for title, url_item, content in news_items:
-                    saved = await save_news_if_new(site_id=site_id, title=title, url=url_item, content=content)
-                    if saved:
-                        saved_count += 1
+async def fetch_news_from_url(url: str) -> List[Tuple[str, str, str]]:
+    """
+    загружает и парсит источник без сохранения в базу.
+    одновременные вызовы для одного нормализованного url ждут одну и ту же задачу
+    """
+    key = normalize_url(url)
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_parse_listing(url))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        print(f"🔗 загрузка {key} уже выполняется, жду ее результат")
+
+    # shield: отмена одного ожидающего не должна отменять загрузку для остальных
+    return list(await asyncio.shield(task))
+
+async def _parse_listing(url: str) -> List[Tuple[str, str, str]]:
+    """загружает страницу со списком новостей и извлекает контент найденных новостей"""
+    try:
+        if FEED_DISCOVERY:
+            # быстрый путь: rss/atom лента уже содержит заголовки, ссылки и описания
+            news_items = await _parse_feed_fast_path(url)
+            if news_items:
+                return news_items
 
-                print(f"✅ сохранено {saved_count} новостей в базу данных")
-            except Exception as e:
-                print(f"⚠️ предупреждение: не удалось сохранить новости в базу данных: {e}")
-        else:
-            print("⚠️ предупреждение: site_id не указан, новости не будут сохранены в базу данных")
+        print(f"🔍 начинаем парсинг сайта: {url}")
+        page = await fetch_page(url, timeout=HTTP_LISTING_TIMEOUT)
+        if page.unchanged:
+            # страница не изменилась - берем прошлый разбор, html не парсим
+            return [tuple(item) for item in json.loads(page.payload)]
+        print(f"✅ сайт загружен, размер: {len(page.body)} байт")
+        candidates = await run_parse(select_news_links, page.body, url)
 
-        return news_items[:15]
+        news_items = await _build_news_items(candidates, {})
+        await remember_page(url, page, json.dumps(news_items, ensure_ascii=False))
+        return news_items
 
     except Exception as e:
         logging.error(f"❌ ошибка парсинга {url}: {e}")
         return []
 
+async def _parse_feed_fast_path(url: str) -> List[Tuple[str, str, str]]:
+    """
+    новости из ленты источника или [] - тогда разбирается html. лента, которая не отвечает
+    или пуста, забывается до следующего поиска, чтобы не заглушить источник на FEED_RECHECK_HOURS
+    """
+    try:
+        feed_url = await discover_feed(url)
+        if not feed_url:
+            return []
+    except Exception as e:
+        print(f"⚠️ не удалось найти ленту для {url}: {e}")
+        return []
+
+    try:
+        news_items = await _parse_feed_listing(url, feed_url)
+    except Exception as e:
+        print(f"⚠️ лента {feed_url} недоступна, разбираю html: {e}")
+        news_items = []
+    if not news_items:
+        await forget_feed(url)
+    return news_items
+
+async def _parse_feed_listing(url: str, feed_url: str) -> List[Tuple[str, str, str]]:
+    """новости из ленты источника; статьи загружаются только для записей без описания"""
+    page = await fetch_page(feed_url, timeout=HTTP_LISTING_TIMEOUT)
+    if page.unchanged:
+        return [tuple(item) for item in json.loads(page.payload)]
+    entries = await run_parse(parse_feed, page.body, url, feed_url)
+
+    if not entries:
+        return []
+    print(f"📡 в ленте {feed_url} найдено {len(entries)} записей")
+    news_items = await _build_news_items(
+        [(title, link) for title, link, _ in entries],
+        {link: content for _, link, content in entries if len(content) >= 10}
+    )
+    await remember_page(feed_url, page, json.dumps(news_items, ensure_ascii=False))
+    return news_items
+
+async def _build_news_items(candidates: List[Tuple[str, str]], contents: Dict[str, str]) -> List[Tuple[str, str, str]]:
+    """
+    собирает (заголовок, url, контент) для найденных ссылок. контент берется из contents,
+    из уже сохраненных новостей или со страницы статьи
+    """
+    news_items = []
+
+    # для ссылок, которые уже есть в таблице news, берем сохраненный контент одним запросом
+    missing = [href for _, href in candidates if href not in contents]
+    known_contents = await get_known_news_contents(missing) if missing else {}
+    if known_contents:
+        print(f"⏭️ не загружаю {len(known_contents)} уже известных новостей")
+    to_extract = [(text, href) for text, href in candidates if href not in contents and href not in known_contents]
+
+    # извлекаем контент новых новостей параллельно, gather сохраняет порядок ссылок
+    extracted = await asyncio.gather(*(extract_news_content(href, text) for text, href in to_extract))
+    extracted_contents = {href: content for (_, href), content in zip(to_extract, extracted)}
+
+    found_news_count = 0
+    for text, href in candidates:
+        content = contents.get(href) or known_contents.get(href) or extracted_contents.get(href)
+        # если не удалось извлечь контент, используем заголовок как контент
+        if not content or len(content) < 10:
+            content = text[:200]
+
+        # очищаем заголовок
+        title = re.sub(r'\s+', ' ', text).strip()
+
+        news_items.append((title, href, content))
+        found_news_count += 1
+        print(f"✅ найдена новость {found_news_count}: {title[:50]}...")
+        print(f"   url: {href}")
+        print(f"   content: {content[:100]}...")
+
+    print(f"📊 всего найдено новостей: {found_news_count}")
+    print(f"📊 всего уникальных новостей: {len(news_items)}")
+
+    return news_items[:15]
+
 async def extract_news_content(news_url: str, fallback_title: str) -> Optional[str]:
     """
     Извлекает контент новости по ее URL
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-            'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-            'Accept-Encoding': 'gzip, deflate, br',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-        }
-        
-        # Делаем паузу между запросами
-        time.sleep(1)
-        
-        response = requests.get(news_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
+        # паузы между запросами к одному сайту выдерживает http-клиент
+        page = await fetch_page(news_url, timeout=HTTP_ARTICLE_TIMEOUT)
+        if page.unchanged:
+            return page.payload
+        content = await run_parse(extract_content_from_html, page.body, news_url, fallback_title)
+
+        if content:
+            await remember_page(news_url, page, content)
+        return content
 
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # Специальная логика для разных сайтов
-        domain = ''
-        try:
-            from urllib.parse import urlparse
-            domain = urlparse(news_url).netloc
-        except:
-            pass
-        
-        content = ""
-        
-        # Для habr.com
-        if 'habr.com' in domain:
-            # Ищем основной контент статьи
-            content_selectors = [
-                '.article-formatted-body', '.post__text', '.article-formatted-body--full',
-                '.post__text-html', '.article__text', '.post-content'
-            ]
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if len(text) > 100:  # Для habr.com требуем более длинный текст
-                        content += " " + text
-                        if len(content) > 500:  # Больше контента для habr.com
-                            break
-                if len(content) > 500:
-                    break
-        
-        # Для tass.ru
-        elif 'tass.ru' in domain:
-            # Ищем основной контент новости
-            content_selectors = [
-                '.article__text', '.text', '.article-body', '.news-text',
-                '.article__content', '.text-block', '.article__body'
-            ]
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if len(text) > 50:
-                        content += " " + text
-                        if len(content) > 400:
-                            break
-                if len(content) > 400:
-                    break
-        
-        # Для других сайтов - стандартная логика
-        else:
-            content_selectors = [
-                'article', '.article', '.content', '.text', '.body',
-                '.post-content', '.entry-content', '.news-content',
-                '.story', '.story-body', '.article-body', '.post-body',
-                'div[class*="content"]', 'div[class*="text"]', 'div[class*="body"]',
-                'p', '.lead', '.summary', '.description'
-            ]
-            
-            for selector in content_selectors:
-                elements = soup.select(selector)
-                for element in elements:
-                    text = element.get_text(strip=True)
-                    if len(text) > 50:  # Игнорируем слишком короткие тексты
-                        content += " " + text
-                        if len(content) > 300:  # Ограничиваем длину
-                            break
-                if len(content) > 300:
-                    break
-        
-        # Если не нашли контент, пытаемся найти хотя бы мета-описание
-        if not content or len(content) < 30:
-            meta_desc = soup.find('meta', attrs={'name': 'description'})
-            if meta_desc:
-                content = meta_desc.get('content', '')
-        
-        # Если все еще нет контента, используем заголовок
-        if not content or len(content) < 10:
-            content = fallback_title[:200]
-        
-        # Очищаем контент от лишних пробелов
-        content = re.sub(r'\s+', ' ', content).strip()
-        
-        return content[:500] if content else None
-        
     except Exception as e:
         print(f"⚠️ Не удалось извлечь контент для {news_url}: {e}")
         return None
 
+def select_news_links(body: bytes, url: str) -> List[Tuple[str, str]]:
+    """
+    ссылки на новости со страницы-списка: [(заголовок ссылки, url)] в порядке появления.
+    выполняется в пуле процессов разбора
+    """
+    print(f"🔍 парсинг новостей с {url}")
+
+    # со страницы-списка нужны только ссылки - полное дерево не строим
+    all_links = extract_links(body)
+    print(f"🔍 найдено {len(all_links)} ссылок на странице")
+
+    candidates = []  # (заголовок ссылки, url) в порядке появления на странице
+    processed_urls = set()  # для избежания дубликатов
+
+    for href, text in all_links[:100]:  # проверяем первые 100 ссылок
+        if not href or not text or len(text) < 5:
+            continue
+
+        # очищаем и нормализуем url
+        href = clean_url(href, url)
+        
+        # проверяем на дубликаты
+        if href in processed_urls:
+            continue
+        processed_urls.add(href)
+
+        # проверяем, является ли это ссылкой на новость
+        if is_news_link(href, url):
+            candidates.append((text, href))
+            if len(candidates) >= 15:  # ограничиваем количество найденных новостей
+                break
+
+    return candidates
+
+def extract_content_from_html(body: bytes, news_url: str, fallback_title: str) -> Optional[str]:
+    """текст новости со страницы статьи, не длиннее 500 символов. выполняется в пуле процессов разбора"""
+    soup = make_soup(body)
+
+    # селекторы и пороги берутся из профиля сайта, для остальных - общий профиль
+    profile = profile_for(urlparse(news_url).netloc)
+    content = ""
+    for selector in profile.content_selectors:
+        for element in selector.select(soup):
+            text = element.get_text(strip=True)
+            if len(text) > profile.min_block_length:  # Игнорируем слишком короткие тексты
+                content += " " + text
+                if len(content) > profile.content_length:  # Ограничиваем длину
+                    break
+        if len(content) > profile.content_length:
+            break
+
+    # Если не нашли контент, пытаемся найти хотя бы мета-описание
+    if not content or len(content) < 30:
+        meta_desc = soup.find('meta', attrs={'name': 'description'})
+        if meta_desc:
+            content = meta_desc.get('content', '')
+
+    # Если все еще нет контента, используем заголовок
+    if not content or len(content) < 10:
+        content = fallback_title[:200]
+
+    # Очищаем контент от лишних пробелов
+    content = re.sub(r'\s+', ' ', content).strip()
+
+    return content[:500] if content else None
+
 def clean_url(link: str, base_url: str) -> str:
     """Очищает и нормализует URL"""
     if not link:
@@ -238,85 +283,29 @@ def is_news_link(link: str, base_url: str) -> bool:
     if not link:
         return False
 
-    from urllib.parse import urlparse
     parsed = urlparse(link)
     path = parsed.path.lower()
 
-    # Исключаем явно не новостные ссылки
-    exclude_patterns = [
-        '/press', '/category', '/tag', '/tags', '/archive', '/page',
-        '/author', '/authors', '/search', '/rss', '/feed', '/sitemap',
-        '/contact', '/about', '/privacy', '/terms', '/policy',
-        '/login', '/register', '/signup', '/admin', '/wp-admin',
-        '/dashboard', '/profile', '/settings', '/account',
-        '/press-center', '/press-service', '/press-releases',
-        '/proisshestviya', '/politics', '/economy', '/sport', '/culture',
-        '/world', '/russia', '/regions', '/society', '/business',
-        '/science', '/technology', '/auto', '/realty', '/health'
-    ]
-
-    for pattern in exclude_patterns:
-        if pattern in path:
-            return False
-
-    # Специальная логика для разных сайтов
-    domain = parsed.netloc
-    
-    # Для habr.com
-    if 'habr.com' in domain:
-        # Принимаем ссылки на новости и статьи
-        if '/news/' in path or '/articles/' in path or '/companies/' in path:
-            return True
-        # Принимаем ссылки с ID (например /ru/news/990184/)
-        if re.search(r'/\d+/', path):
-            return True
-        return False
-    
-    # Для tass.ru
-    if 'tass.ru' in domain:
-        # Принимаем ссылки на новости в разных разделах
-        if '/news/' in path or '/mejdunarodnaya-panorama/' in path or '/politika/' in path or '/obschestvo/' in path:
-            return True
-        # Принимаем ссылки с ID (например /politika/26275619)
-        if re.search(r'/\d+$', path):
-            return True
-        return False
+    # правила из профиля домена ссылки, если он есть, иначе общие
+    profile = get_profile(parsed.netloc)
+    rules = profile or default_profile()
 
-    # Для новостных сайтов проверяем по домену
-    if parsed.netloc != urlparse(base_url).netloc:
-        news_domains = ['tass.ru', 'ria.ru', 'interfax.ru', 'kommersant.ru', 'vedomosti.ru']
-        if any(domain in parsed.netloc for domain in news_domains):
-            return True
+    # Исключаем явно не новостные ссылки
+    if any(pattern in path for pattern in rules.exclude_patterns):
         return False
 
-    # Стандартные паттерны для других сайтов
-    date_pattern = r'/\d{4}/\d{1,2}/\d{1,2}/'  # /2023/12/29/
-    id_pattern = r'/\d{4,}/'  # Числа от 4 цифр и больше
-    news_pattern = r'/news/'  # Прямое указание на новости
-    article_pattern = r'/article/'  # Статьи
-    story_pattern = r'/story/'  # Истории/новости
-
-    if (re.search(date_pattern, path) or
-        re.search(id_pattern, path) or
-        re.search(news_pattern, path) or
-        re.search(article_pattern, path) or
-        re.search(story_pattern, path)):
-        return True
+    if profile:
+        return any(pattern.search(path) for pattern in profile.link_patterns)
 
-    # Если URL достаточно длинный и содержит цифры - вероятно это новость
-    if len(path) > 20 and re.search(r'\d', path):
-        return True
+    # Для ссылок на другие сайты принимаем только известные новостные домены
+    if parsed.netloc != urlparse(base_url).netloc:
+        return any(domain in parsed.netloc for domain in rules.external_news_domains)
 
-    return False
+    # Стандартные паттерны: дата, длинный id, /news/, /article/, /story/, длинный путь с цифрами
+    return any(pattern.search(path) for pattern in rules.link_patterns)
 
 def filter_news_by_keywords(news_list: List[Tuple[str, str, str]], keywords: List[str]) -> List[Tuple[str, str, str]]:
     """Фильтрует новости по ключевым словам"""
     if not keywords:
         return news_list
-
-    filtered = []
-    for title, url, content in news_list:
-        text = f"{title} {content}".lower()
-        if any(keyword.lower() in text for keyword in keywords):
-            filtered.append((title, url, content))
-    return filtered
\ No newline at end of file
+    return compile_keywords(keywords).filter(news_list)
\ No newline at end of file
@@ -0,0 +1,40 @@
+from typing import Optional, Tuple
+
+from config import ADAPTIVE_MIN_FACTOR, ADAPTIVE_MAX_FACTOR, ADAPTIVE_SMOOTHING
+
+def poll_bounds(check_interval: int) -> Tuple[int, int]:
+    """границы интервала опроса в секундах для интервала пользователя в минутах"""
+    base = check_interval * 60
+    low = max(60, int(base * ADAPTIVE_MIN_FACTOR))
+    high = max(low, int(base * ADAPTIVE_MAX_FACTOR))
+    return low, high
+
+def compute_poll_interval(previous: Optional[int], check_interval: int,
+                          items_per_day: Optional[float], idle_seconds: Optional[int]) -> int:
+    """
+    новый интервал опроса источника в секундах.
+    previous - прошлый интервал (None - интервал пользователя),
+    items_per_day - сколько новых ссылок в день появляется в списке источника,
+    до фильтрации по ключевым словам (None - еще не измерено),
+    idle_seconds - сколько времени в списке не было новых ссылок (None - неизвестно)
+    """
+    low, high = poll_bounds(check_interval)
+    if previous is None:
+        previous = check_interval * 60
+
+    # опрашиваем примерно дважды между публикациями; без публикаций - как можно реже
+    if items_per_day is None:
+        target = check_interval * 60
+    else:
+        target = 86400 / (2 * items_per_day) if items_per_day > 0 else high
+
+    if idle_seconds is not None:
+        if idle_seconds < target:
+            # источник только что публиковал - проверяем чаще, чем по средней частоте
+            target = idle_seconds
+        else:
+            # чем дольше список не меняется, тем реже опрос
+            target = max(target, idle_seconds / 2)
+
+    smoothed = (1 - ADAPTIVE_SMOOTHING) * previous + ADAPTIVE_SMOOTHING * target
+    return int(min(high, max(low, smoothed)))
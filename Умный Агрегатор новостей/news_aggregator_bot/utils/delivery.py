@@ -0,0 +1,194 @@
+import asyncio
+import time
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import (
+    DELIVERY_GLOBAL_RATE, DELIVERY_CHAT_RATE, DELIVERY_WORKERS,
+    DELIVERY_MAX_ATTEMPTS, DELIVERY_POLL_INTERVAL, DELIVERY_KEEP_DAYS,
+    DELIVERY_ACK_BATCH, DELIVERY_ACK_INTERVAL
+)
+from database import (
+    enqueue_outbox, get_pending_outbox, get_pending_outbox_chats,
+    mark_outbox_sent, reschedule_outbox, mark_outbox_failed, prune_outbox
+)
+
+class TokenBucket:
+    """ведро токенов: не больше rate операций в секунду с запасом capacity"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """дождаться токена"""
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """не выдавать токены ближайшие seconds секунд (после RetryAfter от telegram)"""
+        self._refill()
+        self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+_global_bucket: Optional[TokenBucket] = None
+_chat_buckets: Dict[int, TokenBucket] = {}
+_ready: Optional[asyncio.Queue] = None  # чаты, у которых есть что отправить
+_queued_chats: Set[int] = set()  # чаты в очереди или в работе, чтобы не обслуживать один чат дважды
+_tasks: List[asyncio.Task] = []
+
+# подтверждения отправки: id сообщений, уже принятых telegram, но еще не записанных в базу.
+# пока id здесь, сообщение считается отправленным и повторно не уходит
+_acked: List[int] = []
+_acked_ids: Set[int] = set()
+_ack_full: Optional[asyncio.Event] = None
+_flush_lock: Optional[asyncio.Lock] = None
+
+def _chat_bucket(chat_id: int) -> TokenBucket:
+    bucket = _chat_buckets.get(chat_id)
+    if bucket is None:
+        bucket = TokenBucket(DELIVERY_CHAT_RATE, 1)
+        _chat_buckets[chat_id] = bucket
+    return bucket
+
+def _wake_chat(chat_id: int):
+    if _ready is None or chat_id in _queued_chats:
+        return
+    _queued_chats.add(chat_id)
+    _ready.put_nowait(chat_id)
+
+async def enqueue_messages(messages: List[Tuple[int, str, List[int]]]) -> int:
+    """
+    поставить сообщения (chat_id, text, id новостей в сообщении) в сохраняемую очередь отправки.
+    сообщение, все новости которого уже стоят в очереди этого чата, игнорируется. возвращает число добавленных
+    """
+    added = await enqueue_outbox(messages)
+    for chat_id in {chat_id for chat_id, _, _ in messages}:
+        _wake_chat(chat_id)
+    return added
+
+async def _deliver_chat(bot: Bot, chat_id: int):
+    """отправить сообщения одного чата по порядку; при ошибке остановиться, чтобы не нарушить порядок"""
+    for outbox_id, text, attempts in await get_pending_outbox(chat_id, int(time.time())):
+        if outbox_id in _acked_ids:
+            continue
+        # сначала токен чата: пока воркер ждет свой чат, общий лимит достается другим чатам
+        await _chat_bucket(chat_id).acquire()
+        await _global_bucket.acquire()
+        try:
+            await bot.send_message(chat_id, text, parse_mode='HTML', disable_web_page_preview=True)
+        except TelegramRetryAfter as e:
+            print(f"⏳ Telegram просит подождать {e.retry_after} с для чата {chat_id}")
+            # ограничение flood control действует на весь бот - останавливаем и общую отправку
+            _chat_bucket(chat_id).pause(e.retry_after)
+            _global_bucket.pause(e.retry_after)
+            await reschedule_outbox(outbox_id, int(time.time()) + e.retry_after, attempts, str(e))
+            _wake_chat_later(chat_id, e.retry_after)
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # бот заблокирован или сообщение некорректно - повтор не поможет
+            print(f"❌ Ошибка отправки сообщения {outbox_id} в чат {chat_id}: {e}")
+            await mark_outbox_failed(outbox_id, str(e))
+            continue
+        except Exception as e:
+            attempts += 1
+            if attempts >= DELIVERY_MAX_ATTEMPTS:
+                print(f"❌ Сообщение {outbox_id} в чат {chat_id} не отправлено после {attempts} попыток: {e}")
+                await mark_outbox_failed(outbox_id, str(e))
+                continue
+            delay = 2 ** attempts
+            print(f"⚠️ Ошибка отправки в чат {chat_id}, повтор через {delay} с: {e}")
+            await reschedule_outbox(outbox_id, int(time.time()) + delay, attempts, str(e))
+            _wake_chat_later(chat_id, delay)
+            return
+
+        _ack(outbox_id)
+
+def _ack(outbox_id: int):
+    """запомнить, что telegram принял сообщение; в базу запишется пачкой"""
+    _acked.append(outbox_id)
+    _acked_ids.add(outbox_id)
+    if len(_acked) >= DELIVERY_ACK_BATCH and _ack_full is not None:
+        _ack_full.set()
+
+async def flush_acks():
+    """записать накопленные подтверждения одной транзакцией"""
+    async with _flush_lock:
+        batch = _acked[:]
+        if not batch:
+            return
+        # при ошибке id остаются в буфере и запишутся при следующей попытке
+        await mark_outbox_sent(batch)
+        del _acked[:len(batch)]
+        _acked_ids.difference_update(batch)
+
+async def _ack_loop():
+    while True:
+        try:
+            await asyncio.wait_for(_ack_full.wait(), DELIVERY_ACK_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _ack_full.clear()
+        try:
+            await flush_acks()
+        except Exception as e:
+            print(f"❌ Ошибка записи подтверждений отправки: {e}")
+
+def _wake_chat_later(chat_id: int, delay: float):
+    asyncio.get_running_loop().call_later(delay, _wake_chat, chat_id)
+
+async def _worker(bot: Bot):
+    while True:
+        chat_id = await _ready.get()
+        try:
+            await _deliver_chat(bot, chat_id)
+        except Exception as e:
+            print(f"❌ Ошибка доставки в чат {chat_id}: {e}")
+        finally:
+            _queued_chats.discard(chat_id)
+            _ready.task_done()
+
+async def _recovery_loop():
+    """подхватывает сообщения, оставшиеся в очереди после перезапуска, и чистит старые"""
+    while True:
+        try:
+            for chat_id in await get_pending_outbox_chats(int(time.time())):
+                _wake_chat(chat_id)
+            await prune_outbox(int(time.time()) - DELIVERY_KEEP_DAYS * 86400)
+        except Exception as e:
+            print(f"❌ Ошибка проверки очереди отправки: {e}")
+        await asyncio.sleep(DELIVERY_POLL_INTERVAL)
+
+def start_delivery(bot: Bot):
+    global _global_bucket, _ready, _ack_full, _flush_lock
+    print("Запускаю отправку сообщений...")
+    _global_bucket = TokenBucket(DELIVERY_GLOBAL_RATE, DELIVERY_GLOBAL_RATE)
+    _ready = asyncio.Queue()
+    _ack_full = asyncio.Event()
+    _flush_lock = asyncio.Lock()
+    _tasks.append(asyncio.create_task(_recovery_loop()))
+    _tasks.append(asyncio.create_task(_ack_loop()))
+    for _ in range(DELIVERY_WORKERS):
+        _tasks.append(asyncio.create_task(_worker(bot)))
+
+async def stop_delivery():
+    """остановить отправку и записать оставшиеся подтверждения"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    if _flush_lock is not None:
+        await flush_acks()
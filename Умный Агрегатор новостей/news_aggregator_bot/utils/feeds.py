@@ -0,0 +1,182 @@
+import html
+import re
+import time
+import xml.etree.ElementTree as ET
+from typing import List, Optional, Tuple
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from config import FEED_COMMON_PATHS, FEED_RECHECK_HOURS, HTTP_LISTING_TIMEOUT
+from database import get_feed, save_feed
+from utils.http_client import request
+from utils.parse_pool import run_parse
+
+FEED_TYPES = ('application/rss+xml', 'application/atom+xml', 'application/rdf+xml')
+
+_LINK_TAGS = SoupStrainer('link')
+
+def _local(tag: str) -> str:
+    """имя тега без пространства имен"""
+    return tag.rsplit('}', 1)[-1]
+
+def _child_text(element: ET.Element, *names: str) -> str:
+    """текст первого непустого дочернего тега; имена проверяются по порядку приоритета"""
+    for name in names:
+        for child in element:
+            if _local(child.tag) == name and (child.text or '').strip():
+                return child.text.strip()
+    return ''
+
+def _item_link(entry: ET.Element) -> str:
+    """ссылка записи rss: link, а guid - только если link нет и guid объявлен ссылкой"""
+    link = _child_text(entry, 'link')
+    if link:
+        return link
+    for child in entry:
+        if _local(child.tag) == 'guid' and child.get('isPermaLink', 'true').lower() != 'false':
+            return (child.text or '').strip()
+    return ''
+
+def _clean_text(text: str) -> str:
+    # описания в лентах часто содержат html - оставляем только текст
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', text))
+    return re.sub(r'\s+', ' ', text).strip()
+
+def find_feed_links(body: bytes, base_url: str) -> List[str]:
+    """ссылки на ленты из <link rel="alternate"> страницы; ленты комментариев пропускаются"""
+    soup = BeautifulSoup(body, 'html.parser', parse_only=_LINK_TAGS)
+    links = []
+    for link in soup.find_all('link', href=True):
+        rel = [value.lower() for value in (link.get('rel') or [])]
+        if 'alternate' in rel and (link.get('type') or '').lower() in FEED_TYPES:
+            href = urljoin(base_url, link['href'])
+            if 'comments' not in href.lower() and href not in links:
+                links.append(href)
+    return links
+
+def candidate_feed_urls(url: str) -> List[str]:
+    """типичные адреса лент: сначала внутри раздела, потом от корня сайта"""
+    parsed = urlparse(url)
+    root = f"{parsed.scheme}://{parsed.netloc}"
+    section = parsed.path.rstrip('/')
+    candidates = []
+    for path in FEED_COMMON_PATHS:
+        for base in ([root + section] if section else []) + [root]:
+            candidate = base + path
+            if candidate not in candidates:
+                candidates.append(candidate)
+    return candidates
+
+def _section_filter(listing_url: str, feed_url: str) -> Optional[str]:
+    """
+    префикс пути, которым ограничить записи ленты, или None.
+    общая лента сайта для страницы раздела ограничивается ссылками этого раздела
+    """
+    section = urlparse(listing_url).path.rstrip('/')
+    if not section:
+        return None
+    slug = section.rsplit('/', 1)[-1]
+    if slug and slug in urlparse(feed_url).path:
+        return None  # лента самого раздела
+    return section + '/'
+
+def parse_feed(body: bytes, listing_url: str, feed_url: str, limit: int = 15) -> Optional[List[Tuple[str, str, str]]]:
+    """
+    разбирает rss 2.0 / rss 1.0 / atom / news-sitemap в [(заголовок, url, описание)].
+    возвращает None, если это не лента. выполняется в пуле процессов разбора
+    """
+    try:
+        root = ET.fromstring(body)
+    except ET.ParseError:
+        return None
+
+    kind = _local(root.tag)
+    if kind == 'rss':
+        entries = [element for element in root.iter() if _local(element.tag) == 'item']
+    elif kind == 'RDF':
+        entries = [element for element in root if _local(element.tag) == 'item']
+    elif kind == 'feed':
+        entries = [element for element in root if _local(element.tag) == 'entry']
+    elif kind == 'urlset':
+        entries = list(root)
+    else:
+        return None
+
+    prefix = _section_filter(listing_url, feed_url)
+    items = []
+    seen = set()
+    for entry in entries:
+        if kind == 'feed':
+            link = ''
+            for child in entry:
+                if _local(child.tag) == 'link' and child.get('rel', 'alternate') == 'alternate':
+                    link = child.get('href', '')
+                    break
+            title = _child_text(entry, 'title')
+            content = _child_text(entry, 'summary', 'content')
+        elif kind == 'urlset':
+            link = _child_text(entry, 'loc')
+            news = next((child for child in entry if _local(child.tag) == 'news'), None)
+            title = _child_text(news, 'title') if news is not None else ''
+            content = ''
+        else:
+            link = _item_link(entry)
+            title = _child_text(entry, 'title')
+            content = _child_text(entry, 'description', 'encoded')
+
+        if not link or not title:
+            continue
+        link = urljoin(feed_url, link.strip())
+        if prefix and not urlparse(link).path.startswith(prefix):
+            continue
+        if link in seen:
+            continue
+        seen.add(link)
+
+        items.append((_clean_text(title), link, _clean_text(content)[:500]))
+        if len(items) >= limit:
+            break
+    return items
+
+async def _probe(feed_url: str, listing_url: str) -> bool:
+    try:
+        status, body, _ = await request(feed_url, timeout=HTTP_LISTING_TIMEOUT)
+    except Exception:
+        return False
+    if status != 200:
+        return False
+    return bool(await run_parse(parse_feed, body, listing_url, feed_url))
+
+async def discover_feed(url: str) -> Optional[str]:
+    """
+    адрес ленты для страницы-списка: из кэша, из <link rel="alternate"> или по типичным путям.
+    результат (и отсутствие ленты) кэшируется на FEED_RECHECK_HOURS
+    """
+    cached = await get_feed(url)
+    now = int(time.time())
+    if cached and now - cached[1] < FEED_RECHECK_HOURS * 3600:
+        return cached[0]
+
+    print(f"📡 ищу rss/atom ленту для {url}")
+    candidates = []
+    try:
+        _, listing_body, _ = await request(url, timeout=HTTP_LISTING_TIMEOUT)
+        candidates.extend(await run_parse(find_feed_links, listing_body, url))
+    except Exception as e:
+        print(f"⚠️ не удалось загрузить {url} для поиска ленты: {e}")
+    candidates.extend(candidate for candidate in candidate_feed_urls(url) if candidate not in candidates)
+
+    feed_url = None
+    for candidate in candidates:
+        if await _probe(candidate, url):
+            feed_url = candidate
+            break
+
+    print(f"📡 лента для {url}: {feed_url or 'не найдена, разбираю html'}")
+    await save_feed(url, feed_url, now)
+    return feed_url
+
+async def forget_feed(url: str):
+    """лента перестала отдавать записи - разбирать html до следующего поиска ленты"""
+    await save_feed(url, None, int(time.time()))
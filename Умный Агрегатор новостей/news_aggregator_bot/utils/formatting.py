@@ -0,0 +1,99 @@
+import html
+from typing import List, Tuple
+from urllib.parse import urlparse
+
+# лимит длины текста одного сообщения telegram
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+def get_domain(url: str) -> str:
+    return urlparse(url).netloc.replace('www.', '')
+
+def format_news_message(title: str, url: str, content: str) -> str:
+    """одна новость - одно сообщение"""
+    content = content or ''
+    # определить тип контента
+    content_type = "📰"
+    if "видео" in title.lower() or "🎥" in content or "🎬" in content:
+        content_type = "🎬"
+
+    # форматировать заголовок; текст новости экранируется - сообщение уходит с parse_mode html
+    formatted_title = title[:100] + "..." if len(title) > 100 else title
+
+    news_text = f"{content_type} <b>{html.escape(formatted_title)}</b>\n"
+    news_text += f"📍 Источник: {html.escape(get_domain(url))}\n"
+
+    if content and content.strip() and content != "Новость без описания":
+        clean_content = content.replace('\n', ' ').strip()
+        if len(clean_content) > 250:
+            clean_content = clean_content[:250] + "..."
+        news_text += f"\n📝 {html.escape(clean_content)}\n\n"
+    else:
+        news_text += "\n"
+
+    news_text += f"🔗 <a href='{html.escape(url, quote=True)}'>Читать полностью</a>\n"
+    news_text += f"{'─' * 30}"
+    return news_text
+
+def _format_digest_item(title: str, url: str, content: str, content_limit: int) -> str:
+    title = title[:100] + "..." if len(title) > 100 else title
+    line = f"• <a href='{html.escape(url, quote=True)}'>{html.escape(title)}</a>\n"
+    clean_content = (content or '').replace('\n', ' ').strip()
+    if clean_content and content_limit > 0:
+        if len(clean_content) > content_limit:
+            clean_content = clean_content[:content_limit] + "..."
+        line += f"   {html.escape(clean_content)}\n"
+    return line
+
+def build_digest(items: List[Tuple[int, str, str, str]], content_limit: int = 150,
+                 limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[Tuple[str, List[int]]]:
+    """
+    упаковывает новости (news_id, title, url, content) в как можно меньше сообщений,
+    сгруппировав по домену. возвращает список (текст, id новостей в этом сообщении)
+    """
+    by_domain = {}
+    for item in items:
+        by_domain.setdefault(get_domain(item[2]), []).append(item)
+
+    header = "🗞 <b>Дайджест новостей</b>\n"
+    messages = []
+    text, news_ids, current_domain = header, [], None
+
+    for domain, domain_items in by_domain.items():
+        for news_id, title, url, content in domain_items:
+            line = _format_digest_item(title, url, content, content_limit)
+            domain_header = f"\n📍 <b>{html.escape(domain)}</b>\n"
+            addition = (domain_header if domain != current_domain else "") + line
+
+            if len(text) + len(addition) > limit and news_ids:
+                # текущее сообщение заполнено - начинаем новое, повторив заголовок домена
+                messages.append((text, news_ids))
+                text, news_ids = header, []
+                addition = domain_header + line
+
+            if len(text) + len(addition) > limit:
+                # одна новость не помещается даже в пустое сообщение - без описания
+                addition = domain_header + _format_digest_item(title, url, '', 0)
+
+            text += addition
+            news_ids.append(news_id)
+            current_domain = domain
+
+    if news_ids:
+        messages.append((text, news_ids))
+    return messages
+
+def _highlight(snippet: str) -> str:
+    """сниппет fts5 в html: найденные слова (между \x02 и \x03) выделяются жирным"""
+    return html.escape(snippet).replace('\x02', '<b>').replace('\x03', '</b>')
+
+def format_search_results(query: str, results: List[Tuple[int, str, str, str]],
+                          page: int, pages: int, total: int) -> str:
+    """страница результатов /search: (news_id, title, url, сниппет) в порядке релевантности"""
+    text = f"🔎 <b>{html.escape(query)}</b>: найдено {total}, страница {page + 1} из {pages}\n"
+    for _, title, url, snippet in results:
+        title = title[:100] + "..." if len(title) > 100 else title
+        text += f"\n• <a href='{html.escape(url, quote=True)}'>{html.escape(title)}</a>\n"
+        text += f"   📍 {html.escape(get_domain(url))}\n"
+        if snippet:
+            text += f"   {_highlight(snippet.replace(chr(10), ' ').strip())}\n"
+    return text
@@ -0,0 +1,47 @@
+import sqlite3
+from typing import Dict, List, Set, Tuple
+
+from utils.morphology import stem, tokenize
+
+# токенизатор fts5: слова в нижнем регистре, без диакритики (ё и е совпадают).
+# тот же, что у таблицы news_fts (миграция 8)
+FTS_TOKENIZE = 'unicode61 remove_diacritics 2'
+
+def fts_query(text: str) -> str:
+    """
+    безопасный запрос MATCH из произвольного текста: все слова обязательны,
+    каждое ищется по основе как префикс, так что "выборы" находит и "выборов".
+    пустая строка - в тексте нет слов
+    """
+    terms = []
+    for token in tokenize(text):
+        base = stem(token)
+        # короткую основу как префикс не берем - под нее подойдет слишком много слов
+        term = f'"{base}"*' if len(base) >= 3 else f'"{token}"'
+        if term not in terms:
+            terms.append(term)
+    return ' '.join(terms)
+
+def match_batch(news_list: List[Tuple[str, str, str]], queries: Dict[str, str]) -> Dict[str, Set[int]]:
+    """
+    проверить пачку новостей (title, url, content) запросами fts5 {ключ: запрос}.
+    пачка индексируется во временной таблице в памяти, каждый запрос - поиск по индексу.
+    возвращает {ключ: номера подошедших новостей}
+    """
+    matches = {key: set() for key in queries}
+    if not news_list or not queries:
+        return matches
+    conn = sqlite3.connect(':memory:')
+    try:
+        conn.execute(f"CREATE VIRTUAL TABLE batch USING fts5(title, content, tokenize='{FTS_TOKENIZE}')")
+        conn.executemany(
+            'INSERT INTO batch (rowid, title, content) VALUES (?, ?, ?)',
+            [(i + 1, title, content or '') for i, (title, _, content) in enumerate(news_list)]
+        )
+        for key, query in queries.items():
+            if query:
+                rows = conn.execute('SELECT rowid FROM batch WHERE batch MATCH ?', (query,))
+                matches[key] = {rowid - 1 for rowid, in rows}
+    finally:
+        conn.close()
+    return matches
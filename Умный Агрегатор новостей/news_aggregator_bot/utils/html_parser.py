@@ -0,0 +1,60 @@
+from typing import List, Optional, Tuple
+
+from bs4 import BeautifulSoup, SoupStrainer, UnicodeDammit
+
+from config import HTML_PARSER
+
+# необязательные быстрые парсеры: lxml строит дерево для BeautifulSoup,
+# selectolax используется только для выборки ссылок со страниц-списков
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as HTMLParser
+    HAS_SELECTOLAX = True
+except ImportError:
+    try:
+        from selectolax.parser import HTMLParser  # selectolax < 0.3.13
+        HAS_SELECTOLAX = True
+    except ImportError:
+        HTMLParser = None
+        HAS_SELECTOLAX = False
+
+_LINKS_ONLY = SoupStrainer('a', href=True)
+
+def _resolve_backends(name: str) -> Tuple[str, str]:
+    """(построитель дерева для BeautifulSoup, парсер для выборки ссылок) по настройке HTML_PARSER"""
+    if name == 'html.parser':
+        return 'html.parser', 'html.parser'
+    if name in ('lxml', 'selectolax') and not (HAS_LXML if name == 'lxml' else HAS_SELECTOLAX):
+        print(f"⚠️ {name} не установлен, выбираю парсер автоматически")
+    soup_backend = 'lxml' if HAS_LXML else 'html.parser'
+    if name == 'lxml':
+        return soup_backend, soup_backend
+    return soup_backend, 'selectolax' if HAS_SELECTOLAX else soup_backend
+
+SOUP_BACKEND, LINKS_BACKEND = _resolve_backends(HTML_PARSER)
+
+def make_soup(body: bytes, backend: Optional[str] = None) -> BeautifulSoup:
+    """полное дерево страницы для выборки контента css-селекторами"""
+    return BeautifulSoup(body, backend or SOUP_BACKEND)
+
+def extract_links(body: bytes, backend: Optional[str] = None) -> List[Tuple[str, str]]:
+    """
+    только ссылки страницы: [(href, текст ссылки)] в порядке появления.
+    остальные элементы в дерево не попадают
+    """
+    backend = backend or LINKS_BACKEND
+    if backend == 'selectolax':
+        # кодировку определяем так же, как BeautifulSoup (заголовок, meta charset), не только utf-8
+        tree = HTMLParser(UnicodeDammit(body, is_html=True).unicode_markup or '')
+        return [
+            (node.attributes.get('href') or '', node.text(deep=True, separator='', strip=True))
+            for node in tree.css('a[href]')
+        ]
+
+    soup = BeautifulSoup(body, backend, parse_only=_LINKS_ONLY)
+    return [(link.get('href'), link.get_text(strip=True)) for link in soup.find_all('a', href=True)]
@@ -0,0 +1,59 @@
+import hashlib
+from typing import NamedTuple, Optional
+
+from database import get_http_cache, save_http_cache
+from utils.http_client import request
+
+class CachedPage(NamedTuple):
+    """результат условной загрузки: либо новое тело, либо сохраненный разбор"""
+    body: Optional[bytes]
+    payload: Optional[str]
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_hash: Optional[str]
+
+    @property
+    def unchanged(self) -> bool:
+        return self.body is None
+
+async def fetch_page(url: str, timeout: Optional[float] = None) -> CachedPage:
+    """
+    загружает страницу с If-None-Match / If-Modified-Since.
+    при 304 или совпадении хэша тела возвращает сохраненный payload без тела,
+    чтобы вызывающий код пропустил разбор html
+    """
+    cached = await get_http_cache(url)
+    headers = {}
+    # валидаторы отправляем только если есть сохраненный разбор, который можно вернуть
+    if cached and cached[3] is not None:
+        etag, last_modified, _, _ = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+
+    status, body, response_headers = await request(url, timeout=timeout, headers=headers or None)
+
+    if status == 304 and cached and cached[3] is not None:
+        print(f"♻️ страница не изменилась (304): {url}")
+        return CachedPage(None, cached[3], cached[0], cached[1], cached[2])
+
+    content_hash = hashlib.sha1(body).hexdigest()
+    etag = response_headers.get('ETag')
+    last_modified = response_headers.get('Last-Modified')
+
+    if cached and cached[3] is not None and cached[2] == content_hash:
+        print(f"♻️ страница не изменилась (хэш совпал): {url}")
+        page = CachedPage(None, cached[3], etag or cached[0], last_modified or cached[1], content_hash)
+        if (page.etag, page.last_modified) != (cached[0], cached[1]):
+            await remember_page(url, page, cached[3])
+        return page
+
+    return CachedPage(body, None, etag, last_modified, content_hash)
+
+async def remember_page(url: str, page: CachedPage, payload: str):
+    """сохраняет валидаторы вместе с результатом разбора, чтобы переиспользовать его при 304"""
+    try:
+        await save_http_cache(url, page.etag, page.last_modified, page.content_hash, payload)
+    except Exception as e:
+        print(f"⚠️ не удалось сохранить http-кэш для {url}: {e}")
@@ -0,0 +1,95 @@
+import asyncio
+import aiohttp
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import (
+    HTTP_CONNECT_TIMEOUT, HTTP_TOTAL_TIMEOUT, HTTP_POOL_LIMIT,
+    HTTP_POOL_LIMIT_PER_HOST, HTTP_KEEPALIVE_TIMEOUT,
+    FETCH_CONCURRENCY, FETCH_PER_HOST_CONCURRENCY, FETCH_HOST_DELAY
+)
+
+# заголовки по умолчанию для всех запросов парсера
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+    'Accept-Encoding': 'gzip, deflate',
+    'DNT': '1',
+    'Upgrade-Insecure-Requests': '1',
+}
+
+# общая сессия с пулом соединений (создается лениво внутри event loop)
+_session: Optional[aiohttp.ClientSession] = None
+
+# ограничители параллельных загрузок: общий и по каждому сайту
+_global_semaphore: Optional[asyncio.Semaphore] = None
+_host_semaphores: Dict[str, asyncio.Semaphore] = {}
+# время (loop.time()), раньше которого нельзя начинать следующий запрос к сайту
+_host_next_slot: Dict[str, float] = {}
+
+def get_session() -> aiohttp.ClientSession:
+    """возвращает общую сессию, при необходимости создает ее"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+        )
+        timeout = aiohttp.ClientTimeout(total=HTTP_TOTAL_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT)
+        _session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=DEFAULT_HEADERS)
+    return _session
+
+def _get_global_semaphore() -> asyncio.Semaphore:
+    global _global_semaphore
+    if _global_semaphore is None:
+        _global_semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    return _global_semaphore
+
+def _get_host_semaphore(host: str) -> asyncio.Semaphore:
+    semaphore = _host_semaphores.get(host)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(FETCH_PER_HOST_CONCURRENCY)
+        _host_semaphores[host] = semaphore
+    return semaphore
+
+async def _wait_host_slot(host: str):
+    """
+    выдерживает паузу между запросами к одному сайту.
+    слот резервируется сразу, поэтому ждет только эта корутина, а не весь loop
+    """
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    slot = max(now, _host_next_slot.get(host, 0.0))
+    _host_next_slot[host] = slot + FETCH_HOST_DELAY
+    if slot > now:
+        await asyncio.sleep(slot - now)
+
+async def request(url: str, timeout: Optional[float] = None,
+                  headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes, Dict[str, str]]:
+    """
+    выполняет GET с ограничениями параллельности и возвращает (статус, тело, заголовки ответа).
+    ответы 4xx/5xx превращаются в исключение, 304 возвращается как есть
+    """
+    session = get_session()
+    request_timeout = None
+    if timeout is not None:
+        request_timeout = aiohttp.ClientTimeout(total=timeout, connect=HTTP_CONNECT_TIMEOUT)
+
+    host = urlparse(url).netloc.lower()
+    async with _get_host_semaphore(host):
+        await _wait_host_slot(host)
+        async with _get_global_semaphore():
+            async with session.get(url, timeout=request_timeout, headers=headers) as response:
+                response.raise_for_status()
+                body = await response.read()
+                return response.status, body, dict(response.headers)
+
+async def close_session():
+    """закрывает общую сессию при остановке бота"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,278 @@
+from collections import deque
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+from config import KEYWORD_MATCH_MODE
+from database import get_all_keywords
+from db_pool import run_read
+from utils.fts import fts_query, match_batch
+from utils.morphology import stem_tokens
+
+# необязательный автомат на C (пакет pyahocorasick), без него - реализация на python
+try:
+    import ahocorasick
+    HAS_AHOCORASICK = True
+except ImportError:
+    ahocorasick = None
+    HAS_AHOCORASICK = False
+
+class KeywordMatcher:
+    """
+    автомат Ахо-Корасик по набору ключевых слов: один проход по тексту находит все вхождения,
+    поэтому стоимость проверки не растет с числом ключевых слов. регистр не учитывается
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: FrozenSet[str] = frozenset(k.strip().lower() for k in keywords if k and k.strip())
+        if HAS_AHOCORASICK and self.keywords:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                self._automaton.add_word(keyword, keyword)
+            self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._build()
+
+    def _build(self):
+        # бор: переходы, суффиксные ссылки и слова, заканчивающиеся в состоянии
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[str, ...]] = [()]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                state = next_state
+            self._out[state] += (keyword,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._out[next_state] += self._out[self._fail[next_state]]
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def find(self, text: str) -> Set[str]:
+        """все ключевые слова, входящие в текст"""
+        text = text.lower()
+        if self._automaton is not None:
+            return {keyword for _, keyword in self._automaton.iter(text)}
+        found = set()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+    def search(self, text: str) -> bool:
+        """есть ли в тексте хотя бы одно ключевое слово"""
+        text = text.lower()
+        if self._automaton is not None:
+            return next(self._automaton.iter(text), None) is not None
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                return True
+        return False
+
+    def filter(self, news_list: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        """оставить новости (title, url, content), в которых есть ключевое слово; без слов - все"""
+        if not self.keywords:
+            return news_list
+        return [item for item in news_list if self.search(f"{item[0]} {item[2]}")]
+
+class StemMatcher:
+    """
+    сравнение по основам слов: ключевая фраза подходит, если все ее основы есть среди основ новости.
+    основы новости считаются один раз при загрузке, проверка - поиск в множестве
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: FrozenSet[str] = frozenset(k.strip().lower() for k in keywords if k and k.strip())
+        # основа -> фразы, в которых она есть: проверяются только фразы, задетые основами новости
+        self._by_stem: Dict[str, List[FrozenSet[str]]] = {}
+        for keyword in self.keywords:
+            stems = stem_tokens(keyword)
+            if stems:
+                self._by_stem.setdefault(min(stems), []).append(stems)
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def search_tokens(self, tokens: FrozenSet[str]) -> bool:
+        for token in tokens:
+            for stems in self._by_stem.get(token, ()):
+                if stems <= tokens:
+                    return True
+        return False
+
+    def search(self, text: str) -> bool:
+        return self.search_tokens(stem_tokens(text))
+
+    def filter(self, news_list: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        """как KeywordMatcher.filter"""
+        if not self.keywords:
+            return news_list
+        return [item for item in news_list if self.search(f"{item[0]} {item[2]}")]
+
+class FtsMatcher:
+    """
+    сравнение через полнотекстовый индекс sqlite fts5: ключевое слово превращается в запрос
+    (utils/fts.fts_query) и ищется так же, как в /search. пачка новостей индексируется один раз
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: FrozenSet[str] = frozenset(k.strip().lower() for k in keywords if k and k.strip())
+        self._queries = {keyword: fts_query(keyword) for keyword in self.keywords}
+
+    def __bool__(self) -> bool:
+        return bool(self.keywords)
+
+    def filter(self, news_list: List[Tuple[str, str, str]]) -> List[Tuple[str, str, str]]:
+        """как KeywordMatcher.filter. синхронный - для помощников вне цикла событий; сбор новостей идет через route_items"""
+        if not self.keywords:
+            return news_list
+        matched = set().union(*match_batch(news_list, self._queries).values())
+        return [item for i, item in enumerate(news_list) if i in matched]
+
+_MATCHERS = {'morphology': StemMatcher, 'fts': FtsMatcher}
+
+@lru_cache(maxsize=1024)
+def _compile(keywords: FrozenSet[str], mode: str):
+    return _MATCHERS.get(mode, KeywordMatcher)(keywords)
+
+def compile_keywords(keywords: Iterable[str], mode: str = KEYWORD_MATCH_MODE):
+    """автомат для набора слов в режиме mode; одинаковые наборы компилируются один раз"""
+    return _compile(frozenset(k.strip().lower() for k in keywords if k and k.strip()), mode)
+
+class SubscriptionIndex:
+    """
+    обратный индекс подписок: ключевое слово (или основа) -> сайты, которые на него подписаны.
+    новость проверяется одним проходом по ее тексту сразу для всех подписок,
+    и стоимость зависит от числа совпадений, а не от общего числа подписок
+    """
+
+    def __init__(self, keywords: List[Tuple[int, str]], mode: str = KEYWORD_MATCH_MODE):
+        self.mode = mode
+        self.filtered_sites: Set[int] = set()  # сайты с ключевыми словами; остальные получают все новости
+        self._sites_by_keyword: Dict[str, Set[int]] = {}
+        self._keywords_by_site: Dict[int, Set[str]] = {}
+        for site_id, keyword in keywords:
+            keyword = (keyword or '').strip().lower()
+            if keyword:
+                self._sites_by_keyword.setdefault(keyword, set()).add(site_id)
+                self._keywords_by_site.setdefault(site_id, set()).add(keyword)
+                self.filtered_sites.add(site_id)
+
+        if mode == 'fts':
+            # запросы fts5 проверяются по пачке новостей источника, см. _route_fts
+            self._queries = {keyword: fts_query(keyword) for keyword in self._sites_by_keyword}
+        elif mode == 'morphology':
+            # основа -> (основы фразы, сайты); фраза проверяется, только если в новости есть ее первая основа
+            self._by_stem: Dict[str, List[Tuple[FrozenSet[str], Set[int]]]] = {}
+            for keyword, site_ids in self._sites_by_keyword.items():
+                stems = stem_tokens(keyword)
+                if stems:
+                    self._by_stem.setdefault(min(stems), []).append((stems, site_ids))
+        else:
+            self._matcher = KeywordMatcher(self._sites_by_keyword)
+
+    def route(self, text: str) -> Set[int]:
+        """
+        сайты с ключевыми словами, которым подходит новость. в режиме 'fts' синхронный поиск
+        по временной таблице - для помощников вне цикла событий; сбор новостей идет через route_items
+        """
+        sites = set()
+        if self.mode == 'morphology':
+            tokens = stem_tokens(text)
+            for token in tokens:
+                for stems, site_ids in self._by_stem.get(token, ()):
+                    if stems <= tokens:
+                        sites |= site_ids
+        elif self.mode == 'fts':
+            for keyword, positions in match_batch([(text, '', '')], self._queries).items():
+                if positions:
+                    sites |= self._sites_by_keyword[keyword]
+        elif self._sites_by_keyword:
+            for keyword in self._matcher.find(text):
+                sites |= self._sites_by_keyword[keyword]
+        return sites
+
+    async def route_items(self, news_list: List[Tuple[str, str, str]],
+                          site_ids: Iterable[int]) -> Dict[int, List[Tuple[str, str, str]]]:
+        """
+        раздать новости (title, url, content) одного источника его подпискам site_ids:
+        {site_id: подходящие новости}. каждая новость проверяется один раз
+        """
+        site_ids = set(site_ids)
+        unfiltered = site_ids - self.filtered_sites
+        if self.mode == 'fts':
+            item_sites = await self._route_fts(news_list, site_ids)
+        else:
+            item_sites = [self.route(f"{title} {content}") & site_ids for title, _, content in news_list]
+
+        routed = {site_id: [] for site_id in site_ids}
+        for item, sites in zip(news_list, item_sites):
+            for site_id in unfiltered | sites:
+                routed[site_id].append(item)
+        return routed
+
+    async def _route_fts(self, news_list: List[Tuple[str, str, str]], site_ids: Set[int]) -> List[Set[int]]:
+        """
+        сайты из site_ids для каждой новости пачки; проверяются только ключевые слова этих сайтов.
+        таблица fts5 строится и опрашивается в потоке чтения, а не в цикле событий
+        """
+        keywords = set()
+        for site_id in site_ids:
+            keywords |= self._keywords_by_site.get(site_id, set())
+        item_sites = [set() for _ in news_list]
+        if not keywords:
+            return item_sites
+        matches = await run_read(match_batch, news_list, {k: self._queries[k] for k in keywords})
+        for keyword, positions in matches.items():
+            sites = self._sites_by_keyword[keyword] & site_ids
+            for i in positions:
+                item_sites[i] |= sites
+        return item_sites
+
+# индекс всех подписок строится при первом обращении и сбрасывается
+# при изменении ключевых слов (invalidate_keywords)
+_index: Optional[SubscriptionIndex] = None
+_generation = 0  # растет при каждом сбросе, чтобы не закэшировать слова, прочитанные до изменения
+
+async def get_subscription_index() -> SubscriptionIndex:
+    global _index
+    if _index is None:
+        generation = _generation
+        index = SubscriptionIndex(await get_all_keywords())
+        if generation != _generation:
+            return index
+        _index = index
+    return _index
+
+def invalidate_keywords():
+    """сбросить индекс подписок после добавления или удаления ключевых слов или сайтов; индекс общий, строится заново целиком"""
+    global _index, _generation
+    _generation += 1
+    _index = None
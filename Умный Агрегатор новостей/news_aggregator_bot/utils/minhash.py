@@ -0,0 +1,98 @@
+import hashlib
+import re
+from typing import FrozenSet, List, Optional
+
+from utils.morphology import stem, tokenize
+
+# дубликаты ищутся по сходству Жаккара множеств основ слов: пересказ сюжета другим сайтом
+# делит с оригиналом 40-70% основ, разные новости - обычно меньше четверти.
+# кандидаты находит minhash: 64 хэша режутся на 32 полосы по 2, у новостей со сходством 0.35
+# хотя бы одна полоса совпадает с вероятностью 98%, у несвязанных (сходство < 0.1) - редко.
+# кандидат проверяется точным сходством по сохраненным признакам
+NUM_HASHES = 64
+ROWS = 2
+BANDS = NUM_HASHES // ROWS
+MIN_WORDS = 5  # по слишком короткому тексту дубликаты не ищутся - совпадения были бы случайными
+
+# частые слова, которые есть в любой новости и только завышают сходство. сравниваются основы
+_STOP_WORDS = frozenset(stem(word) for word in (
+    'для', 'что', 'это', 'при', 'как', 'так', 'его', 'она', 'они', 'или', 'уже', 'был', 'будет',
+    'также', 'после', 'более', 'который', 'сообщил', 'сообщает', 'заявил', 'говорится',
+))
+_SENTENCE_RE = re.compile(r'(?<=[.!?])\s+')
+_WORD_RE = re.compile(r'\w+')
+
+_PRIME = (1 << 61) - 1
+
+def _hash(feature: str, digest_size: int = 8) -> int:
+    # стабильный между запусками хэш (встроенный hash() для строк рандомизирован)
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=digest_size).digest(), 'big')
+
+# перестановки minhash: h -> (a * h + b) mod p, коэффициенты фиксированы, чтобы полосы
+# новостей, сохраненных в разных запусках, были сравнимы
+_PERMUTATIONS = [(_hash(f'a{i}') % (_PRIME - 1) + 1, _hash(f'b{i}') % _PRIME) for i in range(NUM_HASHES)]
+
+def features(title: str, content: str) -> FrozenSet[str]:
+    """
+    признаки новости: основы слов; '#' + число; '@' + основа имени собственного
+    (слово с заглавной буквы не в начале предложения, заголовок - отдельное предложение)
+    """
+    result = set()
+    for text in (title, content or ''):
+        for token in tokenize(text):
+            if token.isdigit():
+                result.add('#' + token)
+            elif len(token) >= 3:
+                base = stem(token)
+                if base not in _STOP_WORDS:
+                    result.add(base)
+        for sentence in _SENTENCE_RE.split(text):
+            for word in _WORD_RE.findall(sentence)[1:]:
+                if word[0].isupper():
+                    result.add('@' + stem(word))
+    return frozenset(result)
+
+def _words(value: FrozenSet[str]) -> FrozenSet[str]:
+    return frozenset(feature for feature in value if feature[0] not in '#@')
+
+def bands(value: FrozenSet[str]) -> Optional[List[int]]:
+    """полосы minhash по основам слов, по номеру полосы (знаковые 64-битные, как INTEGER sqlite). None - текста мало"""
+    words = _words(value)
+    if len(words) < MIN_WORDS:
+        return None
+    hashes = [_hash(word) % _PRIME for word in words]
+    signature = [min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS]
+    return [
+        int.from_bytes(
+            hashlib.blake2b(repr(signature[band * ROWS:(band + 1) * ROWS]).encode(), digest_size=8).digest(),
+            'big', signed=True
+        )
+        for band in range(BANDS)
+    ]
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """сходство Жаккара основ слов"""
+    words_a, words_b = _words(a), _words(b)
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+def is_duplicate(a: FrozenSet[str], b: FrozenSet[str], threshold: float) -> bool:
+    """
+    одна ли это новость: сходство не ниже threshold, и новости не расходятся в фактах -
+    если в обеих есть числа (или имена собственные), хотя бы одно должно совпасть.
+    так шаблонные новости ("ставка 16%" и "ставка 18%", снегопад в Москве и в Петербурге) не склеиваются
+    """
+    for prefix in '#@':
+        facts_a = {feature for feature in a if feature[0] == prefix}
+        facts_b = {feature for feature in b if feature[0] == prefix}
+        if facts_a and facts_b and not facts_a & facts_b:
+            return False
+    return similarity(a, b) >= threshold
+
+def to_db(value: FrozenSet[str]) -> str:
+    """признаки строкой через пробел - так они хранятся в news.features"""
+    return ' '.join(sorted(value))
+
+def from_db(value: Optional[str]) -> FrozenSet[str]:
+    return frozenset(value.split()) if value else frozenset()
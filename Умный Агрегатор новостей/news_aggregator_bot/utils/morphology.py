@@ -0,0 +1,79 @@
+import re
+from typing import FrozenSet, List
+
+# стеммер Портера (snowball) для русского языка: отрезает окончания, так что
+# "выборы", "выборов" и "выборами" сводятся к одной основе "выбор".
+# латиница и числа только приводятся к нижнему регистру
+
+_VOWELS = 'аеиоуыэюя'
+_TOKEN_RE = re.compile(r'[а-яёa-z0-9]+')
+
+_PERFECTIVE_GERUND = re.compile(r'(?:(?<=[ая])(?:в|вши|вшись)|ив|ивши|ившись|ыв|ывши|ывшись)$')
+_REFLEXIVE = re.compile(r'(?:ся|сь)$')
+_ADJECTIVAL = re.compile(
+    r'(?:(?<=[ая])(?:ем|нн|вш|ющ|щ)|ивш|ывш|ующ)?'
+    r'(?:ее|ие|ые|ое|ими|ыми|ей|ий|ый|ой|ем|им|ым|ом|его|ого|ему|ому|их|ых|ую|юю|ая|яя|ою|ею)$'
+)
+_VERB = re.compile(
+    r'(?:(?<=[ая])(?:ла|на|ете|йте|ли|й|л|ем|н|ло|но|ет|ют|ны|ть|ешь|нно)'
+    r'|ила|ыла|ена|ейте|уйте|ите|или|ыли|ей|уй|ил|ыл|им|ым|ен|ило|ыло|ено|ят|ует|уют|ит|ыт|ены|ить|ыть|ишь|ую|ю)$'
+)
+_NOUN = re.compile(
+    r'(?:а|ев|ов|ие|ье|е|иями|ями|ами|еи|ии|и|ией|ей|ой|ий|й|иям|ям|ием|ем|ам|ом|о|у|ах|иях|ях|ы|ь|ию|ью|ю|ия|ья|я)$'
+)
+_DERIVATIONAL = re.compile(r'ость?$')
+_SUPERLATIVE = re.compile(r'ейше?$')
+
+def _region_start(word: str, start: int) -> int:
+    """начало области после первой согласной, идущей за гласной (R1/R2 алгоритма)"""
+    for i in range(start + 1, len(word)):
+        if word[i] not in _VOWELS and word[i - 1] in _VOWELS:
+            return i + 1
+    return len(word)
+
+def stem(word: str) -> str:
+    """основа слова"""
+    word = word.lower().replace('ё', 'е')
+    match = re.search(f'[{_VOWELS}]', word)
+    if not match:
+        return word
+    # окончания ищутся только в rv - части слова после первой гласной
+    prefix, rv = word[:match.end()], word[match.end():]
+
+    def strip(pattern) -> bool:
+        nonlocal rv
+        found = pattern.search(rv)
+        if found:
+            rv = rv[:found.start()]
+        return bool(found)
+
+    # шаг 1: деепричастие, иначе возвратная частица и окончание прилагательного, глагола или существительного
+    if not strip(_PERFECTIVE_GERUND):
+        strip(_REFLEXIVE)
+        strip(_ADJECTIVAL) or strip(_VERB) or strip(_NOUN)
+
+    # шаг 2
+    if rv.endswith('и'):
+        rv = rv[:-1]
+
+    # шаг 3: словообразовательный суффикс, только в R2
+    r2 = _region_start(word, _region_start(word, 0))
+    found = _DERIVATIONAL.search(rv)
+    if found and len(prefix) + found.start() >= r2:
+        rv = rv[:found.start()]
+
+    # шаг 4: превосходная степень, двойное "н", мягкий знак
+    if strip(_SUPERLATIVE) or rv.endswith('нн'):
+        if rv.endswith('нн'):
+            rv = rv[:-1]
+    elif rv.endswith('ь'):
+        rv = rv[:-1]
+
+    return prefix + rv
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+def stem_tokens(text: str) -> FrozenSet[str]:
+    """множество основ слов текста"""
+    return frozenset(stem(token) for token in tokenize(text))
@@ -1,5 +1,7 @@
 from typing import List, Tuple
 
+from utils.keyword_matcher import compile_keywords
+
 def filter_news_by_keywords(news_list: List[Tuple[str, str, str]], keywords: List[str]) -> List[Tuple[str, str, str]]:
     """
     фильтрует новости по ключевым словам.
@@ -10,12 +12,8 @@ def filter_news_by_keywords(news_list: List[Tuple[str, str, str]], keywords: Lis
     if not keywords:
         return news_list
 
-    filtered = []
-    for title, url, content in news_list:
-        text = f"{title} {content}".lower()
-        if any(keyword.lower() in text for keyword in keywords):
-            filtered.append((title, url, content))
-    return filtered
+    # автомат для набора слов строится один раз и переиспользуется
+    return compile_keywords(keywords).filter(news_list)
 
 def filter_news_by_date(news_list: List[Tuple[str, str, str, str]], days: int) -> List[Tuple[str, str, str, str]]:
 
@@ -0,0 +1,53 @@
+import asyncio
+import functools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import PARSE_PROCESSES, PARSE_BACKLOG_PER_PROCESS
+
+# разбор html нагружает процессор и в одном процессе упирается в GIL,
+# поэтому он выполняется в пуле процессов: туда уходят байты страницы, обратно - короткие кортежи
+_executor: Optional[ProcessPoolExecutor] = None
+_slots: Optional[asyncio.Semaphore] = None
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # spawn: у родителя есть потоки пула sqlite, fork с ними небезопасен
+        _executor = ProcessPoolExecutor(
+            max_workers=PARSE_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor
+
+def parse_slot() -> asyncio.Semaphore:
+    """
+    место в очереди к пулу разбора. берется уже загруженной страницей и отдается после разбора:
+    ограничивает страницы, ждущие парсер, а не сетевые загрузки (их ограничивает http-клиент)
+    """
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(max(1, PARSE_PROCESSES) * PARSE_BACKLOG_PER_PROCESS)
+    return _slots
+
+async def run_parse(func: Callable[..., Any], *args) -> Any:
+    """выполнить функцию разбора в пуле процессов (или в текущем процессе, если пул отключен)"""
+    global _executor
+    if PARSE_PROCESSES <= 1:
+        return func(*args)
+    loop = asyncio.get_running_loop()
+    async with parse_slot():
+        try:
+            return await loop.run_in_executor(_get_executor(), functools.partial(func, *args))
+        except BrokenProcessPool:
+            # процесс пула упал - пересоздаем пул при следующем вызове, эту страницу разбираем здесь
+            print("⚠️ пул процессов разбора сломан, пересоздаю")
+            _executor = None
+            return func(*args)
+
+def close_parse_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
@@ -1,141 +1,248 @@
 import asyncio
+import heapq
+import time
 from aiogram import Bot
-from urllib.parse import urlparse
-
-from database import get_all_sites, get_site_keywords, save_news_if_new, get_new_news_for_site, mark_news_sent
-from parser import parse_news_from_url, filter_news_by_keywords
-
-async def check_and_send_news(bot: Bot):
-    print("🔄 Начинаю проверку новостей...")
-
-    from database import get_sites_to_check, update_site_last_checked
-    sites = await get_sites_to_check()
-
-    print(f"📋 Найдено {len(sites)} сайтов для проверки")
-
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import DEFAULT_CHECK_INTERVAL, SCHEDULER_WORKERS, SCHEDULER_RESYNC_INTERVAL, SCHEDULER_DELIVERY_MAX_DELAY
+from database import (
+    save_news_batch, get_pending_deliveries, mark_news_batch_sent, record_source_activity,
+    get_site_schedule, get_sites_by_ids
+)
+from parser import fetch_news_from_url, normalize_url
+from utils.delivery import enqueue_messages
+from utils.formatting import format_news_message, build_digest
+from utils.keyword_matcher import get_subscription_index
+
+# расписание проверок: куча (next_check_at, site_id) и актуальный срок каждого сайта.
+# записи в куче, срок которых не совпадает с _due_at, устарели и пропускаются
+_heap: List[Tuple[int, int]] = []
+_due_at: Dict[int, int] = {}
+_in_flight: Set[int] = set()  # сайты, которые сейчас проверяются воркерами
+_wakeup: Optional[asyncio.Event] = None  # будит планировщик при изменении расписания
+_delivery_requested: Optional[asyncio.Event] = None
+_queue: Optional[asyncio.Queue] = None  # источники, ожидающие воркера
+_tasks: List[asyncio.Task] = []
+
+def group_sites_by_source(sites: List[tuple]) -> Dict[str, List[tuple]]:
+    """группируем подписки по нормализованному url: каждый источник загружается один раз"""
+    sources = {}
     for site in sites:
-        site_id, user_id, url, last_checked, _ = site
+        sources.setdefault(normalize_url(site[2]), []).append(site)
+    return sources
+
+async def check_source(source_sites: List[tuple]) -> Dict[int, Optional[int]]:
+    """загрузить источник один раз и раздать результат всем подпискам, вернуть {site_id: next_check_at}"""
+    source_url = normalize_url(source_sites[0][2])
+    url = source_sites[0][2]
+    try:
+        # парсим новости с источника
+        print(f"⌛ Начинаю парсинг источника: {source_url} ({len(source_sites)} подписок)")
+        raw_news = await fetch_news_from_url(url)
+        print(f"✅ Получено {len(raw_news)} новостей с источника {source_url}")
+    except Exception as e:
+        print(f"❌ Ошибка при загрузке {source_url}: {e}")
+        raw_news = []
+
+    # частота публикаций источника считается по всем ссылкам списка, а не по сохраненным новостям:
+    # узкие ключевые слова не должны делать активный источник "тихим"
+    if raw_news:
         try:
-            from database import get_user_settings
-            check_interval, max_news_count = await get_user_settings(user_id)
-
-            print(f"📡 Проверяю сайт {url} для пользователя {user_id} (интервал: {check_interval} мин)")
-
-            # парсим новости с сайта
-            print(f"⌛ Начинаю парсинг сайта: {url}")
-            raw_news = await parse_news_from_url(url, site_id)
-            print(f"✅ Получено {len(raw_news)} новостей с сайта {url}")
-
-            if not raw_news:
-                print(f"❌ Не найдено новостей на {url}")
-                # обновляем время проверки даже если новостей нет
-                await update_site_last_checked(site_id)
-                continue
-
-            # получить ключевые слова для фильтрации
-            keywords = await get_site_keywords(site_id)
-            keyword_list = [kw[2] for kw in keywords] if keywords else []
-
-            if keyword_list:
-                filtered_news = filter_news_by_keywords(raw_news, keyword_list)
-            else:
-                filtered_news = raw_news
-
-            # сохранить новые новости
-            new_news_count = 0
-            for title, news_url, content in filtered_news:
-                # фильтруем новости с описанием
-                if content and content.strip() and len(content.strip()) >= 30:
-                    if await save_news_if_new(site_id, title, news_url, content):
-                        new_news_count += 1
-
-            print(f"✅ Сохранено {new_news_count} новых новостей для сайта {url}")
-
-            # обновляем время последней проверки сайта
-            await update_site_last_checked(site_id)
-
+            await record_source_activity(source_url, [news_url for _, news_url, _ in raw_news])
         except Exception as e:
-            print(f"❌ Ошибка при проверке {url}: {e}")
-            # обновляем время проверки даже при ошибке, чтобы не зациклить
-            try:
-                await update_site_last_checked(site_id)
-            except:
-                pass
-
-    # отправить новые новости пользователям
-    await send_new_news_to_users(bot)
+            print(f"⚠️ не удалось записать активность {source_url}: {e}")
+
+    # каждая новость один раз проверяется по общему индексу ключевых слов
+    # и сразу раздается подходящим подпискам на этот источник
+    index = await get_subscription_index()
+    routed = await index.route_items(raw_news, [site[0] for site in source_sites])
+
+    next_checks = {}
+    for site in source_sites:
+        next_checks[site[0]] = await process_site_news(site, raw_news, routed[site[0]])
+    return next_checks
+
+async def process_site_news(site: tuple, raw_news: list, filtered_news: list) -> Optional[int]:
+    """сохранить подходящие новости источника для одной подписки (site_id), вернуть next_check_at"""
+    from database import update_site_last_checked, get_user_settings
+    site_id, user_id, url, last_checked, _ = site
+    source_url = normalize_url(url)
+    try:
+        check_interval, max_news_count = await get_user_settings(user_id)
+
+        print(f"📡 Обрабатываю сайт {url} для пользователя {user_id} (интервал: {check_interval} мин)")
+
+        if not raw_news:
+            print(f"❌ Не найдено новостей на {url}")
+            # обновляем время проверки даже если новостей нет
+            return await update_site_last_checked(site_id, source_url)
+
+        # сохранить новые новости одной транзакцией (только новости с описанием)
+        with_content = [
+            (title, news_url, content) for title, news_url, content in filtered_news
+            if content and content.strip() and len(content.strip()) >= 30
+        ]
+        saved = await save_news_batch(site_id, with_content)
+
+        print(f"✅ Сохранено {len(saved)} новых новостей для сайта {url}")
+
+        # обновляем время последней проверки сайта
+        return await update_site_last_checked(site_id, source_url)
+
+    except Exception as e:
+        print(f"❌ Ошибка при проверке {url}: {e}")
+        # обновляем время проверки даже при ошибке, чтобы не зациклить
+        try:
+            return await update_site_last_checked(site_id, source_url)
+        except:
+            return None
 
 async def send_new_news_to_users(bot: Bot):
     """отправить новые новости всем пользователям"""
     print("📤 Отправляю новые новости пользователям...")
 
-    sites = await get_all_sites()
+    # только неотправленные новости, которых еще нет в очереди, сразу по пользователям.
+    # из новостей одного сюжета отправляется одна, дубликаты уже отправленных сюжетов не отправляются
+    deliveries, duplicates_of_sent = await get_pending_deliveries()
+    if duplicates_of_sent:
+        print(f"🧬 Пропускаю {len(duplicates_of_sent)} повторов уже отправленных сюжетов")
+        await mark_news_batch_sent(duplicates_of_sent)
 
-    for site in sites:
-        site_id, user_id, url, *_ = site
+    for user_id, (delivery_mode, items, duplicates) in deliveries.items():
         try:
-            # получить все новости для этого сайта
-            new_news = await get_new_news_for_site(site_id)
-
-            if new_news:
-                print(f"📰 Отправляю {len(new_news)} новостей пользователю {user_id}")
-
-                # отправить каждую новость отдельно
-                for news_item in new_news[:10]:  # Максимум 10 новостей за раз
-                    news_id, _, title, news_url, content, *_ = news_item
-
-                    # определить тип контента
-                    content_type = "📰"
-                    if "видео" in title.lower() or "🎥" in content or "🎬" in content:
-                        content_type = "🎬"
-
-                    # получить домен сайта
-                    domain = urlparse(news_url).netloc.replace('www.', '')
-
-                    # форматировать заголовок
-                    formatted_title = title[:100] + "..." if len(title) > 100 else title
-
-                    news_text = f"{content_type} <b>{formatted_title}</b>\n"
-                    news_text += f"📍 Источник: {domain}\n"
-
-                    if content and content.strip() and content != "Новость без описания":
-                        clean_content = content.replace('\n', ' ').strip()
-                        if len(clean_content) > 250:
-                            clean_content = clean_content[:250] + "..."
-                        news_text += f"\n📝 {clean_content}\n\n"
-                    else:
-                        news_text += "\n"
-
-                    news_text += f"🔗 <a href='{news_url}'>Читать полностью</a>\n"
-                    news_text += f"{'─' * 30}"
-
-                    try:
-                        await bot.send_message(
-                            user_id,
-                            news_text,
-                            parse_mode='HTML',
-                            disable_web_page_preview=True
-                        )
-
-                        # отмтить как отправленую
-                        await mark_news_sent(news_id)
-
-                    except Exception as e:
-                        print(f"❌ Ошибка отправки новости пользователю {user_id}: {e}")
-
+            print(f"📰 Ставлю в очередь {len(items)} новостей пользователю {user_id}")
+            if delivery_mode == 'digest':
+                messages = [(user_id, text, news_ids) for text, news_ids in build_digest(items)]
+            else:
+                # каждая новость отдельным сообщением через очередь с ограничением скорости
+                messages = [
+                    (user_id, format_news_message(title, news_url, content), [news_id])
+                    for news_id, title, news_url, content in items
+                ]
+            # дубликаты едут в сообщении со своим сюжетом и отмечаются отправленными вместе с ним
+            messages = [
+                (chat_id, text, [i for news_id in news_ids for i in [news_id] + duplicates.get(news_id, [])])
+                for chat_id, text, news_ids in messages
+            ]
+            # новость будет отмечена отправленной (sent_at) после того, как telegram примет сообщение с ней
+            await enqueue_messages(messages)
         except Exception as e:
-            print(f"❌ Ошибка отправки новостей для сайта {site_id}: {e}")
+            print(f"❌ Ошибка отправки новостей пользователю {user_id}: {e}")
+
+def _schedule(site_id: int, due: int):
+    _due_at[site_id] = due
+    heapq.heappush(_heap, (due, site_id))
+
+async def reschedule_sites(user_id: Optional[int] = None):
+    """
+    перечитать время следующей проверки из базы и разбудить планировщик.
+    вызывается после смены интервала или добавления сайта, user_id=None - все сайты
+    """
+    for site_id, due in await get_site_schedule(user_id):
+        _schedule(site_id, due)
+    if _wakeup is not None:
+        _wakeup.set()
+
+async def _dispatch(site_ids: List[int]):
+    """отдать наступившие сайты воркерам, сгруппировав по источнику"""
+    sites = await get_sites_by_ids(site_ids)
+    sources = group_sites_by_source(sites)
+    print(f"📋 Пришло время {len(sites)} сайтов ({len(sources)} источников)")
+    for source_sites in sources.values():
+        _in_flight.update(site[0] for site in source_sites)
+        await _queue.put(source_sites)
 
 async def scheduler_loop(bot: Bot):
+    """ждет ближайшего срока в куче и раздает наступившие сайты воркерам"""
+    loop = asyncio.get_running_loop()
+    await reschedule_sites()
+    last_resync = loop.time()
+
     while True:
         try:
-            await check_and_send_news(bot)
-            print("✅ Проверка новостей завершена, жду 5 минут...")
+            _wakeup.clear()
+
+            # периодическая сверка с базой: подхватить сайты, добавленные в обход reschedule_sites
+            if loop.time() - last_resync >= SCHEDULER_RESYNC_INTERVAL:
+                await reschedule_sites()
+                last_resync = loop.time()
+
+            now = int(time.time())
+            due_ids = []
+            while _heap and _heap[0][0] <= now:
+                due, site_id = heapq.heappop(_heap)
+                # устаревшая запись (срок поменялся) или сайт еще проверяется
+                if _due_at.get(site_id) != due or site_id in _in_flight:
+                    continue
+                del _due_at[site_id]
+                due_ids.append(site_id)
+
+            if due_ids:
+                await _dispatch(due_ids)
+
+            # спим до ближайшего срока или до изменения расписания
+            timeout = SCHEDULER_RESYNC_INTERVAL
+            if _heap:
+                timeout = min(timeout, max(0.0, _heap[0][0] - time.time()))
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
         except Exception as e:
             print(f"❌ Ошибка в цикле планировщика: {e}")
+            await asyncio.sleep(5)
 
-        await asyncio.sleep(5 * 60)  # 5 минут
+async def _worker():
+    """проверяет источники из очереди и ставит их сайты в расписание заново"""
+    while True:
+        source_sites = await _queue.get()
+        site_ids = [site[0] for site in source_sites]
+        next_checks = {}
+        try:
+            next_checks = await check_source(source_sites)
+        except Exception as e:
+            print(f"❌ Ошибка при проверке источника {source_sites[0][2]}: {e}")
+        finally:
+            fallback = int(time.time()) + DEFAULT_CHECK_INTERVAL * 60
+            for site_id in site_ids:
+                _in_flight.discard(site_id)
+                _schedule(site_id, next_checks.get(site_id) or fallback)
+            _queue.task_done()
+            _delivery_requested.set()
+            _wakeup.set()
+
+async def delivery_loop(bot: Bot):
+    """
+    рассылает новые новости после проверок. рассылка ждет, пока воркеры закончат все
+    источники в очереди (но не дольше SCHEDULER_DELIVERY_MAX_DELAY), так что за один тик
+    планировщика пользователь получает одну рассылку, а в режиме дайджеста - один дайджест
+    """
+    while True:
+        await _delivery_requested.wait()
+        try:
+            await asyncio.wait_for(_queue.join(), SCHEDULER_DELIVERY_MAX_DELAY)
+        except asyncio.TimeoutError:
+            pass
+        _delivery_requested.clear()
+        try:
+            await send_new_news_to_users(bot)
+        except Exception as e:
+            print(f"❌ Ошибка рассылки новостей: {e}")
 
 def start_scheduler(bot: Bot):
+    global _wakeup, _delivery_requested, _queue
     print("Запускаю автоматическую проверку новостей...")
-    asyncio.create_task(scheduler_loop(bot))
+    _wakeup = asyncio.Event()
+    _delivery_requested = asyncio.Event()
+    _queue = asyncio.Queue()
+    _tasks.append(asyncio.create_task(scheduler_loop(bot)))
+    _tasks.append(asyncio.create_task(delivery_loop(bot)))
+    for _ in range(SCHEDULER_WORKERS):
+        _tasks.append(asyncio.create_task(_worker()))
+
+async def stop_scheduler():
+    """остановить планировщик и воркеры до закрытия пулов базы и http-сессии"""
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
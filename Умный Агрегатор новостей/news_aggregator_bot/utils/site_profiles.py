@@ -0,0 +1,75 @@
+import json
+import os
+import re
+from typing import List, NamedTuple, Optional, Pattern, Tuple
+
+import soupsieve
+
+from config import SITE_PROFILES_DIR
+
+DEFAULT_PROFILE = 'default'
+
+class SiteProfile(NamedTuple):
+    """правила разбора одного источника, скомпилированные из файла профиля"""
+    name: str
+    domains: Tuple[str, ...]
+    exclude_patterns: Tuple[str, ...]  # подстроки пути, при которых ссылка точно не новость
+    link_patterns: Tuple[Pattern, ...]  # регулярки пути, при которых ссылка считается новостью
+    external_news_domains: Tuple[str, ...]  # чужие домены, ссылки на которые тоже новости
+    content_selectors: Tuple[soupsieve.SoupSieve, ...]
+    min_block_length: int  # блоки текста короче игнорируются
+    content_length: int  # сколько текста набрать для описания новости
+
+_profiles: Optional[List[SiteProfile]] = None
+_default: Optional[SiteProfile] = None
+
+def _compile(raw: dict, base: dict) -> SiteProfile:
+    # поля, не указанные в профиле, берутся из профиля по умолчанию
+    merged = dict(base, **raw)
+    return SiteProfile(
+        name=merged['name'],
+        domains=tuple(domain.lower() for domain in merged.get('domains', [])),
+        exclude_patterns=tuple(merged.get('exclude_patterns', [])),
+        link_patterns=tuple(re.compile(pattern) for pattern in merged.get('link_patterns', [])),
+        external_news_domains=tuple(merged.get('external_news_domains', [])),
+        content_selectors=tuple(soupsieve.compile(selector) for selector in merged.get('content_selectors', [])),
+        min_block_length=int(merged.get('min_block_length', 50)),
+        content_length=int(merged.get('content_length', 300)),
+    )
+
+def load_profiles(directory: str = SITE_PROFILES_DIR) -> List[SiteProfile]:
+    """прочитать и скомпилировать все *.json профили из каталога"""
+    global _profiles, _default
+    raw_profiles = {}
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            raw = json.load(f)
+        raw.setdefault('name', filename[:-len('.json')])
+        raw_profiles[raw['name']] = raw
+
+    base = raw_profiles.pop(DEFAULT_PROFILE, {'name': DEFAULT_PROFILE})
+    _default = _compile(base, {})
+    _profiles = [_compile(raw, base) for raw in raw_profiles.values()]
+    print(f"🧩 загружено профилей сайтов: {len(_profiles)} (+ {DEFAULT_PROFILE})")
+    return _profiles
+
+def get_profile(domain: str) -> Optional[SiteProfile]:
+    """профиль для домена (с учетом поддоменов) или None, если отдельного профиля нет"""
+    if _profiles is None:
+        load_profiles()
+    domain = domain.lower().split(':')[0]
+    for profile in _profiles:
+        if any(domain == d or domain.endswith('.' + d) for d in profile.domains):
+            return profile
+    return None
+
+def default_profile() -> SiteProfile:
+    if _default is None:
+        load_profiles()
+    return _default
+
+def profile_for(domain: str) -> SiteProfile:
+    """профиль домена, а если его нет - общий профиль"""
+    return get_profile(domain) or default_profile()